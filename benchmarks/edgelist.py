@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Compares the chunked edge-list conversion to the line-by-line reference implementation.
+# Usage: benchmarks/edgelist.py [--edges N] [--processes P]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simexpal import instances
+
+def generate_konect(path, num_edges, num_nodes):
+	rng = random.Random(42)
+	with open(path, 'w') as f:
+		f.write('% sym unweighted\n')
+		f.write('% {} {} {}\n'.format(num_edges, num_nodes, num_nodes))
+		batch = []
+		for _ in range(num_edges):
+			batch.append('{} {} 1 {}\n'.format(rng.randrange(num_nodes), rng.randrange(num_nodes),
+					rng.randrange(1 << 30)))
+			if len(batch) == 100000:
+				f.writelines(batch)
+				batch = []
+		f.writelines(batch)
+
+def measure(fn):
+	start = time.perf_counter()
+	fn()
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--edges', type=int, default=5000000)
+	parser.add_argument('--processes', type=int)
+	args = parser.parse_args()
+
+	inst_yml = {'repo': 'konect'}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		in_path = os.path.join(tmp_dir, 'graph.konect')
+		ref_path = os.path.join(tmp_dir, 'graph.ref')
+		out_path = os.path.join(tmp_dir, 'graph.out')
+
+		generate_konect(in_path, args.edges, max(2, args.edges // 10))
+		size = os.path.getsize(in_path)
+		print("Input: {} edges, {:.1f} MiB".format(args.edges, size / (1 << 20)))
+
+		ref_time = measure(lambda: instances.convert_to_edgelist_reference(inst_yml,
+				in_path, ref_path))
+		print("reference: {:8.2f} s ({:.1f} MiB/s)".format(ref_time, size / (1 << 20) / ref_time))
+
+		for chunk_size in [256 << 10, 1 << 20, 4 << 20, 16 << 20]:
+			chunked_time = measure(lambda: instances.convert_to_edgelist(inst_yml,
+					in_path, out_path, chunk_size=chunk_size, processes=args.processes))
+			print("chunked ({:>5} KiB chunks): {:8.2f} s ({:.1f} MiB/s, {:.1f}x)".format(
+					chunk_size >> 10, chunked_time, size / (1 << 20) / chunked_time,
+					ref_time / chunked_time))
+
+			with open(ref_path, 'rb') as ref_f, open(out_path, 'rb') as out_f:
+				if ref_f.read() != out_f.read():
+					print("Output differs from the reference implementation", file=sys.stderr)
+					sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Checks how builds are fetched into the shared repository (builds/<build>.repo), using a local
+# file:// remote. Counts the git fetches (via GIT_TRACE) of the following sequence and fails if
+# refs are fetched more than once, if a fetch runs although nothing is missing or if the shared
+# repository becomes shallow again after a dev-build clone completed its history.
+# Usage: benchmarks/git_fetch.py [--revisions N]
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simexpal import base
+from simexpal import build
+from simexpal import util
+
+def git(*args, cwd=None):
+	return subprocess.check_output(['git', '-c', 'user.name=simexpal',
+			'-c', 'user.email=simexpal@localhost'] + list(args),
+			cwd=cwd, stderr=subprocess.DEVNULL).decode().strip()
+
+def create_remote(path, num_commits):
+	os.makedirs(path)
+	git('init', '-q', cwd=path)
+	for i in range(num_commits):
+		with open(os.path.join(path, 'file'), 'w') as f:
+			f.write('{}\n'.format(i))
+		git('add', 'file', cwd=path)
+		git('commit', '-q', '-m', 'Commit {}'.format(i), cwd=path)
+		git('tag', 'v{}'.format(i), cwd=path)
+
+def write_config(base_dir, remote, versions, dev=False):
+	yml = {
+		'builds': [{'name': 'prog', 'git': 'file://' + remote}],
+		'revisions': [{'name': 'r-' + version, 'build_version': {'prog': version}}
+				for version in versions],
+		'experiments': [{'name': 'e', 'use_builds': ['prog'], 'args': ['true'], 'output': 'stdout'}],
+		'instances': []
+	}
+	if dev:
+		yml['revisions'].append({'name': 'dev', 'develop': True, 'build_version': {'prog': 'master'}})
+	with open(os.path.join(base_dir, 'experiments.yml'), 'w') as f:
+		util.write_yaml_file(f, yml)
+	return base.config_for_dir(basedir=base_dir)
+
+def count_fetches(trace_path):
+	count = 0
+	if not os.access(trace_path, os.F_OK):
+		return count
+	with open(trace_path, 'r') as f:
+		for line in f:
+			if ' built-in: git fetch ' in line:
+				count += 1
+	os.unlink(trace_path)
+	return count
+
+def fetch(cfg):
+	with contextlib.redirect_stdout(io.StringIO()):
+		build.fetch_revisions(cfg, [revision for revision in cfg.all_revisions()
+				if not revision.is_dev_build])
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--revisions', type=int, default=3)
+	args = parser.parse_args()
+
+	failed = False
+	def check(name, condition):
+		nonlocal failed
+		print("{:50} {}".format(name, 'ok' if condition else 'FAIL'))
+		if not condition:
+			failed = True
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		remote = os.path.join(tmp_dir, 'remote')
+		create_remote(remote, args.revisions + 1)
+		head = git('rev-parse', 'HEAD', cwd=remote)
+
+		base_dir = os.path.join(tmp_dir, 'experiments')
+		os.makedirs(base_dir)
+		trace_path = os.path.join(tmp_dir, 'trace')
+		os.environ['GIT_TRACE'] = trace_path
+
+		versions = ['v{}'.format(i) for i in range(args.revisions)]
+		cfg = write_config(base_dir, remote, versions)
+		repo_dir = cfg.get_build('prog', next(iter(cfg.all_revisions()))).repo_dir
+		fetch(cfg)
+		check("all revisions are fetched by a single fetch", count_fetches(trace_path) == 1)
+		check("the shared repository is shallow", build._is_shallow_repo(repo_dir))
+
+		fetch(cfg)
+		check("no fetch if nothing is missing", count_fetches(trace_path) == 0)
+
+		# A dev-build clone completes the history of the shared repository.
+		cfg = write_config(base_dir, remote, versions, dev=True)
+		dev_revision = next(revision for revision in cfg.all_revisions() if revision.is_dev_build)
+		util.try_mkdir(os.path.join(base_dir, 'develop'))
+		with contextlib.redirect_stdout(io.StringIO()):
+			build.make_builds(cfg, dev_revision, [cfg.get_build_info('prog')], ['prog'],
+					[build.Phase.CHECKOUT])
+		count_fetches(trace_path)
+		check("dev-build clone unshallows the shared repository",
+				not build._is_shallow_repo(repo_dir))
+
+		# Commits that are available locally are not fetched again.
+		cfg = write_config(base_dir, remote, versions + [head])
+		fetch(cfg)
+		check("no fetch for locally available commits", count_fetches(trace_path) == 0)
+
+		# New refs are fetched without --depth, i.e., the repository stays complete.
+		cfg = write_config(base_dir, remote, versions + [head, 'v{}'.format(args.revisions)])
+		fetch(cfg)
+		check("new refs are fetched by a single fetch", count_fetches(trace_path) == 1)
+		check("the shared repository is not re-shallowed", not build._is_shallow_repo(repo_dir))
+
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
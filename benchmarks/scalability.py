@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# Measures the overhead of simexpal itself as the experiment matrix grows.
+# Generates a synthetic experiments.yml (and an output tree in which a fraction of the runs
+# is finished) and times the stages that dominate 'simex experiments list/launch' and
+# result collection. Results can be saved and compared to a previous version.
+# Usage: benchmarks/scalability.py [--instances N] [--experiments N] [--axes N] ...
+#            [--save results.json] [--compare old.json]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root_dir)
+
+from simexpal import base
+from simexpal import util
+from simexpal.launch import common
+from simexpal.launch import fork
+
+simex = os.path.join(root_dir, 'scripts', 'simex')
+
+def generate_config(base_dir, args):
+	yml = {
+		'instdir': './instances',
+		'instances': [{
+			'repo': 'local',
+			'items': ['inst{}'.format(i) for i in range(args.instances)]
+		}],
+		'experiments': []
+	}
+
+	if args.revisions:
+		# The build is never compiled; only its revisions are expanded.
+		yml['builds'] = [{'name': 'noop', 'git': 'file:///nonexistent'}]
+		yml['revisions'] = [{'name': 'rev{}'.format(i), 'build_version': {'noop': 'v{}'.format(i)}}
+				for i in range(args.revisions)]
+
+	if args.axes:
+		yml['variants'] = [{
+			'axis': 'axis{}'.format(a),
+			'items': [{'name': 'a{}v{}'.format(a, v), 'extra_args': ['--a{}={}'.format(a, v)]}
+					for v in range(args.variants_per_axis)]
+		} for a in range(args.axes)]
+
+	for e in range(args.experiments):
+		exp_yml = {
+			'name': 'exp{}'.format(e),
+			'args': ['true', '@EXTRA_ARGS@', '@INSTANCE@'],
+			'output': 'stdout',
+			'repeat': args.repetitions
+		}
+		if args.revisions:
+			exp_yml['use_builds'] = ['noop']
+		yml['experiments'].append(exp_yml)
+
+	os.makedirs(os.path.join(base_dir, 'instances'))
+	for item in yml['instances'][0]['items']:
+		util.touch(os.path.join(base_dir, 'instances', item))
+	with open(os.path.join(base_dir, 'experiments.yml'), 'w') as f:
+		util.write_yaml_file(f, yml)
+
+def populate_outputs(cfg, finished):
+	# Every n-th run is finished; the others are not submitted yet.
+	runs = list(cfg.discover_all_runs())
+	if not finished:
+		return (len(runs), 0)
+	step = max(1, round(1 / finished))
+	num_finished = 0
+	for (i, run) in enumerate(runs):
+		if i % step:
+			continue
+		for path in [run.aux_file_path('lock'), run.output_file_path('out')]:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		util.touch(run.aux_file_path('lock'))
+		util.touch(run.aux_file_path('run'))
+		with open(run.output_file_path('out'), 'w') as f:
+			util.write_data_file(f, {'result': i})
+		with open(run.output_file_path('status'), 'w') as f:
+			util.write_data_file(f, {'timeout': False, 'walltime': 0.001 * (i % 100),
+					'status': 0, 'signal': None})
+		num_finished += 1
+	return (len(runs), num_finished)
+
+def measure(fn, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def get_version():
+	try:
+		return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+				cwd=root_dir, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+def run_benchmark(base_dir, args):
+	timings = {}
+	env = os.environ.copy()
+	env['PYTHONPATH'] = os.pathsep.join([root_dir] + ([env['PYTHONPATH']]
+			if 'PYTHONPATH' in env else []))
+
+	timings['config'] = measure(lambda: base.config_for_dir(basedir=base_dir), args.repeat)
+
+	cfg = base.config_for_dir(basedir=base_dir)
+	runs = []
+	def discover():
+		runs[:] = list(cfg.discover_all_runs())
+	timings['discover_all_runs'] = measure(discover, args.repeat)
+
+	timings['get_status'] = measure(lambda: [run.get_status() for run in runs], args.repeat)
+
+	timings['experiments_list'] = measure(lambda: subprocess.run([sys.executable, simex,
+			'experiments', 'list', '--compact'], cwd=base_dir, env=env, stdout=subprocess.DEVNULL,
+			check=True), args.repeat)
+
+	timings['compile_manifest'] = measure(lambda: [common.compile_manifest(run) for run in runs],
+			args.repeat)
+
+	def collect():
+		# Silence the messages about unfinished runs.
+		with contextlib.redirect_stdout(io.StringIO()):
+			cfg.collect_successful_results(lambda run, f: util.read_data_file(f))
+	timings['collect_results'] = measure(collect, args.repeat)
+
+	# Launching is not repeated since it modifies the output tree.
+	pending = [run for run in runs if run.get_status() == base.Status.NOT_SUBMITTED]
+	pending = pending[:args.launch]
+	if pending:
+		launcher = fork.ForkLauncher()
+		start = time.perf_counter()
+		with contextlib.redirect_stdout(io.StringIO()):
+			for run in pending:
+				launcher.submit(cfg, run)
+		timings['fork_launch_per_run'] = (time.perf_counter() - start) / len(pending)
+
+	return timings
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--experiments', type=int, default=4)
+	parser.add_argument('--axes', type=int, default=2)
+	parser.add_argument('--variants-per-axis', type=int, default=3)
+	parser.add_argument('--instances', type=int, default=100)
+	parser.add_argument('--revisions', type=int, default=0)
+	parser.add_argument('--repetitions', type=int, default=2)
+	parser.add_argument('--finished', type=float, default=0.5,
+			help='fraction of runs that are pre-populated as finished')
+	parser.add_argument('--launch', type=int, default=3,
+			help='number of no-op runs to launch through the fork launcher')
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--save', type=str, help='write the results to this JSON file')
+	parser.add_argument('--compare', type=str, help='compare to results saved by --save')
+	args = parser.parse_args()
+
+	params = {name: getattr(args, name) for name in ['experiments', 'axes', 'variants_per_axis',
+			'instances', 'revisions', 'repetitions', 'finished', 'launch']}
+
+	with tempfile.TemporaryDirectory() as base_dir:
+		generate_config(base_dir, args)
+		(num_runs, num_finished) = populate_outputs(base.config_for_dir(basedir=base_dir),
+				args.finished)
+		print("{} runs ({} finished)".format(num_runs, num_finished))
+		timings = run_benchmark(base_dir, args)
+
+	previous = None
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			previous = json.load(f)
+		if previous['params'] != params:
+			print("Warning: {} was measured with different parameters".format(args.compare))
+
+	for (stage, elapsed) in timings.items():
+		line = "{:22} {:10.4f} s".format(stage, elapsed)
+		if previous is not None and stage in previous['timings']:
+			line += "   {:+7.1f}% vs. {}".format(
+					(elapsed / previous['timings'][stage] - 1) * 100, previous['version'])
+		print(line)
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({
+				'version': get_version(),
+				'python': platform.python_version(),
+				'params': params,
+				'num_runs': num_runs,
+				'timings': timings
+			}, f, indent=4, sort_keys=True)
+			f.write('\n')
+
+if __name__ == '__main__':
+	main()
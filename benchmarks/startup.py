@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# Regression check for the startup overhead of 'simex internal-invoke' (which runs once per run
+# on the compute nodes). Invokes a no-op run several times and reports the time that is spent
+# outside of the program itself (i.e., total time minus the walltime in the status file).
+# Fails if the overhead exceeds --max-overhead or if modules are imported that the fast path
+# does not need.
+# Usage: benchmarks/startup.py [--repeat N] [--max-overhead SECONDS]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root_dir)
+
+from simexpal import util
+
+simex = os.path.join(root_dir, 'scripts', 'simex')
+
+# Modules that must not be imported by 'simex internal-invoke --slurm'.
+FORBIDDEN_MODULES = [
+	'argcomplete',
+	'numpy',
+	'requests',
+	'tarfile',
+	'yaml',
+	'zipfile',
+	'simexpal.build',
+	'simexpal.evloop',
+	'simexpal.queuesock',
+	'simexpal.stats',
+	'simexpal.launch.fork',
+	'simexpal.launch.queue',
+	'simexpal.launch.sge',
+	'simexpal.launch.slurm',
+]
+
+def write_specfile(base_dir):
+	for subdir in ['aux', 'output']:
+		os.makedirs(os.path.join(base_dir, subdir, 'noop'), exist_ok=True)
+	manifest_yml = {
+		'config': {
+			'base_dir': base_dir,
+			'instance_dir': os.path.join(base_dir, 'instances')
+		},
+		'experiment': 'noop',
+		'variants': [],
+		'revision': None,
+		'instance': 'inst',
+		'instance_filename': 'inst',
+		'instance_extensions': None,
+		'instance_files': None,
+		'repetition': 0,
+		'builds': {},
+		'args': ['true'],
+		'timeout': None,
+		'environ': {},
+		'output': 'stdout',
+		'workdir': None
+	}
+	spec_path = os.path.join(base_dir, 'noop.spec')
+	with open(spec_path, 'w') as f:
+		util.write_data_file(f, {'manifest': manifest_yml})
+	return spec_path
+
+def read_walltime(base_dir):
+	with open(os.path.join(base_dir, 'output', 'noop', 'inst.status')) as f:
+		return util.read_data_file(f)['walltime']
+
+def get_imported_modules(env, args):
+	proc = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+			env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+	modules = set()
+	for line in proc.stderr.decode().splitlines():
+		if line.startswith('import time:') and '|' in line:
+			modules.add(line.split('|')[-1].strip())
+	return modules
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--max-overhead', type=float, default=0.25)
+	args = parser.parse_args()
+
+	env = os.environ.copy()
+	env['PYTHONPATH'] = os.pathsep.join([root_dir] + ([env['PYTHONPATH']]
+			if 'PYTHONPATH' in env else []))
+
+	with tempfile.TemporaryDirectory() as base_dir:
+		spec_path = write_specfile(base_dir)
+
+		overheads = []
+		for _ in range(args.repeat):
+			start = time.perf_counter()
+			subprocess.run([sys.executable, simex, 'internal-invoke', '--slurm', spec_path],
+					env=env, check=True)
+			overheads.append(time.perf_counter() - start - read_walltime(base_dir))
+
+		start = time.perf_counter()
+		for _ in range(args.repeat):
+			subprocess.run([sys.executable, '-c', 'pass'], check=True)
+		interpreter = (time.perf_counter() - start) / args.repeat
+
+		# Ignore modules that the interpreter imports anyway (e.g., from site-packages' .pth files).
+		modules = (get_imported_modules(env, [simex, 'internal-invoke', '--slurm', spec_path])
+				- get_imported_modules(env, ['-c', 'pass']))
+
+	overhead = statistics.median(overheads)
+	print("Interpreter startup: {:6.1f} ms".format(interpreter * 1000))
+	print("internal-invoke overhead: {:6.1f} ms (median of {} runs, min {:.1f} ms)".format(
+			overhead * 1000, args.repeat, min(overheads) * 1000))
+	print("Modules imported by simex: {}".format(len(modules)))
+
+	failed = False
+	unexpected = sorted(name for name in FORBIDDEN_MODULES if name in modules)
+	if unexpected:
+		print("FAIL: internal-invoke imports {}".format(', '.join(unexpected)))
+		failed = True
+	if overhead > args.max_overhead:
+		print("FAIL: overhead exceeds {:.1f} ms".format(args.max_overhead * 1000))
+		failed = True
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
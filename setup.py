@@ -24,6 +24,10 @@ setup(
 		'argcomplete',
 		'requests',
 		'pyyaml'
-	]
+	],
+	extras_require={
+		'stats': ['numpy'],
+		'arrow': ['pyarrow']
+	}
 )
 
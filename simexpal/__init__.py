@@ -1,5 +1,15 @@
 
-from . import base, launch, util
+import importlib
 
-from .base import config_for_dir
+# Submodules are imported on first access. This keeps light-weight entry points
+# (such as 'simex internal-invoke' on compute nodes) from importing modules they do not use.
+_SUBMODULES = ['base', 'build', 'evloop', 'instances', 'launch', 'nodecache',
+		'profiling', 'queuesock', 'results', 'stats', 'util']
 
+def __getattr__(name):
+	if name in _SUBMODULES:
+		return importlib.import_module('.' + name, __name__)
+	if name == 'config_for_dir':
+		from .base import config_for_dir
+		return config_for_dir
+	raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
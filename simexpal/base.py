@@ -4,9 +4,10 @@ from enum import IntEnum
 import copy
 import itertools
 import os
-import yaml
 
 from . import instances
+from . import profiling
+from . import results
 from . import util
 
 DEFAULT_DEV_BUILD_NAME = '_dev'
@@ -70,6 +71,10 @@ class Config:
 		self._variants = OrderedDict()
 		self._exp_infos = OrderedDict()
 
+		# Memoized file system state of instances (see invalidate_instances()).
+		self._instance_dir = None
+		self._instance_availability = {}
+
 		def check_for_reserved_name(name):
 			if name.startswith('_'):
 				raise RuntimeError(f"Names starting with an underscore are reserved for internal simexpal objects: {name}")
@@ -131,7 +136,19 @@ class Config:
 
 	def instance_dir(self):
 		"""Path of the directory that stores all the instances."""
-		return os.path.join(self.basedir, self.yml['instdir'])
+		if self._instance_dir is None:
+			self._instance_dir = os.path.join(self.basedir, self.yml['instdir'])
+		return self._instance_dir
+
+	def invalidate_instances(self, instance=None):
+		"""
+		Forgets the memoized availability of an instance (or of all instances).
+		Needs to be called when instance files are added or removed outside of Instance.install().
+		"""
+		if instance is None:
+			self._instance_availability.clear()
+		else:
+			self._instance_availability.pop(instance.shortname, None)
 
 	def all_instance_ids(self):
 		for inst in self.all_instances():
@@ -240,31 +257,92 @@ class Config:
 				for revision in revisions_for_experiment(exp_info):
 					for variation in selection.variations:
 						for instance in selection.instances:
+							experiment = Experiment(self, exp_info, revision, variation)
 							if selection.repetitions is not None:
 								reps = range(0, selection.repetitions)
+							elif exp_info.repeat_settings is not None:
+								reps = range(0, adaptive_repetitions(experiment, instance))
 							elif 'repeat' in exp_info._exp_yml:
 								reps = range(0, exp_info._exp_yml['repeat'])
 							else:
 								reps = range(0, 1)
 							for rep in reps:
-								yield (Experiment(self, exp_info, revision, variation), instance, rep)
+								yield (experiment, instance, rep)
+
+		# The matrix expansion may visit the same (experiment, instance) pair multiple times.
+		adaptive_memo = {}
+		def adaptive_repetitions(experiment, instance):
+			memo_key = (experiment.output_subdir, instance.shortname)
+			if memo_key not in adaptive_memo:
+				adaptive_memo[memo_key] = self._num_adaptive_repetitions(experiment, instance)
+			return adaptive_memo[memo_key]
 
 		key = lambda t: (t[0].name, t[0].revision.name if t[0].revision is not None else '_none',
 						 [sub_var.name for sub_var in t[0].variation], t[1].shortname, t[2])
 		for experiment, instance, rep in self._expand_matrix(extract, key=key):
 			yield Run(self, experiment, instance, rep)
 
-	def collect_successful_results(self, parse_fn):
+	# Determines the number of repetitions of an experiment with adaptive repetitions.
+	# We start with the minimal number of repetitions and add one repetition at a time
+	# as long as all existing repetitions finished successfully but the confidence
+	# interval of the metric is still too wide.
+	def _num_adaptive_repetitions(self, experiment, instance):
+		settings = experiment.info.repeat_settings
+
+		def read_metric(run):
+			(status, status_dict) = run.get_status_info()
+			if not status.is_positive:
+				return None
+			if settings['metric'] in status_dict:
+				return float(status_dict[settings['metric']])
+			with open(run.output_file_path('out'), 'r') as f:
+				out_yml = util.read_yaml_file(f)
+			if not isinstance(out_yml, dict) or settings['metric'] not in out_yml:
+				raise RuntimeError("Output of run {}/{}[{}] does not contain metric '{}'".format(
+						experiment.name, instance.shortname, run.repetition, settings['metric']))
+			return float(out_yml[settings['metric']])
+
+		n = settings['min']
+		values = []
+		while True:
+			for rep in range(len(values), n):
+				value = read_metric(Run(self, experiment, instance, rep))
+				if value is None:
+					return n
+				values.append(value)
+			if n >= settings['max'] or util.relative_ci95_width(values) <= settings['ci_width']:
+				return n
+			n += 1
+
+	def collect_successful_results(self, parse_fn, parser_version=None):
 		"""
 		Collects all success runs and parses their output.
 
 		:param: parse_fn: Function to parse the output. Takes two parameters
 			(run, f) where run is a :class:`simexpal.base.Run` object and f
 			is a Python file object.
+		:param: parser_version: If not None, parsed records are stored in a
+			persistent cache (in ``aux/_results/``) and only new or changed
+			outputs are parsed again. The cache is invalidated whenever
+			parser_version changes; hence, it should be changed whenever
+			parse_fn is modified. Records must be picklable.
 		"""
 
+		cache = None
+		if parser_version is not None:
+			cache = results.ResultCache(results.cache_path_for(self, parse_fn), parser_version)
+
 		res = [ ]
 		for run in self.discover_all_runs():
+			if cache is not None:
+				key = os.path.relpath(run.output_file_path('out'), self.basedir)
+				stamp = results.ResultCache.stamp_for(run)
+				if stamp is not None:
+					(hit, record) = cache.lookup(key, stamp)
+					if hit:
+						res.append(record)
+						continue
+
 			finished = os.access(run.output_file_path('status'), os.F_OK)
 			if not finished:
 				print("Skipping unfinished run {}/{}[{}]".format(run.experiment.name,
@@ -272,16 +350,45 @@ class Config:
 				continue
 
 			with open(run.output_file_path('status'), "r") as f:
-				status_dict = yaml.load(f, Loader=yaml.Loader)
+				status_dict = util.read_data_file(f)
 			if status_dict['timeout'] or status_dict['signal'] or status_dict['status'] > 0:
 				print("Skipping failed run {}/{}[{}]".format(run.experiment.name,
 						run.instance.shortname, run.repetition))
 				continue
 
 			with open(run.output_file_path('out'), 'r') as f:
-				res.append(parse_fn(run, f))
+				record = parse_fn(run, f)
+			if cache is not None and stamp is not None:
+				cache.store(key, stamp, record)
+			res.append(record)
+
+		if cache is not None:
+			cache.save()
 		return res
 
+	def collect_run_table(self, runs=None, parse_fn=None, parser_version=None):
+		"""
+		Collects metadata (and optionally parsed results) of runs into a columnar table.
+		See :func:`simexpal.results.collect_run_table`.
+
+		:param: runs: Runs to include. Defaults to all runs.
+		"""
+
+		if runs is None:
+			runs = self.discover_all_runs()
+		return results.collect_run_table(self, runs, parse_fn=parse_fn,
+				parser_version=parser_version)
+
+	def export_run_table(self, path, fmt=None, runs=None, parse_fn=None, parser_version=None):
+		"""
+		Writes one row per run to a CSV, Parquet or Arrow file.
+		The latter two formats require pyarrow.
+		"""
+
+		table = self.collect_run_table(runs=runs, parse_fn=parse_fn,
+				parser_version=parser_version)
+		results.write_run_table(table, path, fmt=fmt)
+
 	# -----------------------------------------------------------------------------------
 	# Matrix expansion.
 	# -----------------------------------------------------------------------------------
@@ -422,6 +529,7 @@ class Instance:
 		self._cfg = cfg
 		self._inst_yml = inst_yml
 		self.index = index
+		self._filenames = None
 
 	@property
 	def filename(self):
@@ -485,12 +593,15 @@ class Instance:
 
 	@property
 	def filenames(self):
-		if self.has_multi_ext:
-			return [self.yml_name + '.' + ext for ext in self._inst_yml['extensions']]
-		elif self.has_multi_files:
-			return [file for file in self._inst_yml['items'][self.index]['files']]
-		else:
-			return [self.yml_name]
+		# The list is memoized; callers must not modify it.
+		if self._filenames is None:
+			if self.has_multi_ext:
+				self._filenames = [self.yml_name + '.' + ext for ext in self._inst_yml['extensions']]
+			elif self.has_multi_files:
+				self._filenames = [file for file in self._inst_yml['items'][self.index]['files']]
+			else:
+				self._filenames = [self.yml_name]
+		return self._filenames
 
 	@property
 	def unique_filename(self):
@@ -498,13 +609,70 @@ class Instance:
 			raise RuntimeError("The instance '{}' does not have a unique filename.".format(self.yml_name))
 		return self.filenames[0]
 
+	@property
+	def expected_checksums(self):
+		"""
+		Maps file names to the SHA-256 hashes that are specified in experiments.yml.
+		The 'sha256' key of an item is either a single hash (for instances with a unique file)
+		or a dictionary from file names to hashes.
+		"""
+		item_yml = self._inst_yml['items'][self.index]
+		if not isinstance(item_yml, dict) or 'sha256' not in item_yml:
+			return {}
+		if isinstance(item_yml['sha256'], dict):
+			return item_yml['sha256']
+		return {self.unique_filename: item_yml['sha256']}
+
+	@property
+	def on_demand(self):
+		"""
+		Settings of on-demand generation (a dictionary with keys 'dir' and 'max_size')
+		or None if the instance is installed into the instance directory.
+		On-demand instances are generated by invoke_run() into a node-local cache.
+		"""
+		if 'on_demand' not in self._inst_yml:
+			return None
+		if 'generator' not in self._inst_yml:
+			raise RuntimeError("The instance '{}' uses 'on_demand' but does not have a generator".format(
+					self.yml_name))
+		on_demand_yml = self._inst_yml['on_demand']
+		if isinstance(on_demand_yml, str):
+			on_demand_yml = {'dir': on_demand_yml}
+		return {
+			'dir': os.path.expanduser(on_demand_yml['dir']),
+			'max_size': on_demand_yml.get('max_size', None)
+		}
+
+	@property
+	def info_path(self):
+		return os.path.join(self._cfg.instance_dir(), self.shortname + '.info')
+
+	@property
+	def info(self):
+		"""
+		Statistics of the instance that are computed by 'simex instances process'
+		(e.g., n, m, self_loops, duplicate_edges and degree) or None if it was not processed.
+		"""
+		return instances.read_info(self.info_path)
+
 	def check_available(self):
-		for file in self.filenames:
-			if not os.path.isfile(os.path.join(self._cfg.instance_dir(), file)):
-				return False
-		return True
+		# Availability is memoized per Config; install() invalidates it.
+		available = self._cfg._instance_availability.get(self.shortname)
+		if available is None:
+			instance_dir = self._cfg.instance_dir()
+			available = all(os.path.isfile(os.path.join(instance_dir, file))
+					for file in self.filenames)
+			self._cfg._instance_availability[self.shortname] = available
+		return available
 
 	def install(self):
+		self._cfg.invalidate_instances(self)
+		try:
+			self._install()
+		finally:
+			self._cfg.invalidate_instances(self)
+
+	def _install(self):
 		if self.check_available():
 			return
 
@@ -523,38 +691,29 @@ class Instance:
 					self.config.instance_dir(), self.unique_filename, partial_path, '.post0')
 		else:
 			assert 'generator' in self._inst_yml
-			import subprocess
-
-			def substitute(p):
-				if p == 'INSTANCE_FILENAME':
-					return self.unique_filename
-				raise RuntimeError("Unexpected parameter {}".format(p))
-
 			print("Generating instance '{}'".format(self.unique_filename))
 
-			assert isinstance(self._inst_yml['generator']['args'], list)
-			cmd = [util.expand_at_params(arg_tmpl, substitute) for arg_tmpl
-					in self._inst_yml['generator']['args']]
+			cmd = instances.get_generator_command(self._inst_yml, self.unique_filename)
+			instances.run_generator(cmd, partial_path + '.post0', self.config.basedir)
 
-			with open(partial_path + '.gen', 'w') as f:
-				subprocess.check_call(cmd, cwd=self.config.basedir,
-						stdout=f, stderr=subprocess.PIPE)
-			os.rename(partial_path + '.gen', partial_path + '.post0')
+		instances.postprocess_instance(self._inst_yml, partial_path)
 
-		stage = 0
-		if 'postprocess' in self._inst_yml:
-			assert self._inst_yml['postprocess'] == 'to_edgelist'
-			instances.convert_to_edgelist(self._inst_yml,
-					partial_path + '.post0', partial_path + '.post1');
-			os.unlink(partial_path + '.post0')
-			stage = 1
+	def transform_path(self, transform):
+		"""Default output path of a transformation (see instances.TRANSFORM_EXTENSIONS)."""
+		return os.path.join(self._cfg.instance_dir(),
+				self.yml_name + '.' + instances.TRANSFORM_EXTENSIONS[transform])
 
-		os.rename(partial_path + '.post{}'.format(stage), partial_path)
+	def run_transform(self, transform, out_path=None):
+		if out_path is None:
+			out_path = self.transform_path(transform)
 
-	def run_transform(self, transform, out_path):
-		assert transform == 'to_edgelist'
-		instances.convert_to_edgelist(self._inst_yml,
-				self.fullpath, out_path + '.transf1');
+		if transform == 'to_edgelist':
+			instances.convert_to_edgelist(self._inst_yml,
+					self.fullpath, out_path + '.transf1');
+		elif transform == 'to_csr':
+			instances.convert_to_csr(self.fullpath, out_path + '.transf1')
+		else:
+			raise RuntimeError("Unknown transformation {}".format(transform))
 		stage = 1
 
 		os.rename(out_path + '.transf{}'.format(stage), out_path)
@@ -629,6 +788,14 @@ class BuildInfo:
 	def regenerate(self):
 		return self._build_yml.get('regenerate', [])
 
+	@property
+	def compiler_cache(self):
+		"""Name of the compiler launcher (e.g., ccache) or None if no compiler cache is used."""
+		launcher = self._build_yml.get('compiler_cache', False)
+		if launcher is True:
+			return 'ccache'
+		return launcher or None
+
 class Revision:
 	def __init__(self, cfg, revision_yml):
 		self._cfg = cfg
@@ -673,9 +840,7 @@ class Build:
 
 	@property
 	def repo_dir(self):
-		# Use the source_dir property for dev-build revisions
-		assert not self.revision.is_dev_build
-
+		# Shared by all revisions; dev-builds only use it as a reference when cloning.
 		return os.path.join(self._cfg.basedir, 'builds', self.name + '.repo')
 
 	@property
@@ -702,6 +867,11 @@ class Build:
 		rev = '@' + self.revision.name
 		return os.path.join(self._cfg.basedir, 'builds', self.name + rev)
 
+	@property
+	def log_file(self):
+		"""Log file for the output of build steps (only used for concurrent builds)."""
+		return self.prefix_dir + '.log'
+
 	@property
 	def source_dir(self):
 		"""
@@ -791,6 +961,29 @@ class ExperimentInfo:
 	def slurm_args(self):
 		return self._exp_yml.get('slurm_args',[])
 
+	@property
+	def repeat_settings(self):
+		"""
+		Settings for adaptive repetitions or None if the experiment uses a fixed
+		number of repetitions.
+		"""
+		repeat_yml = self._exp_yml.get('repeat', None)
+		if not isinstance(repeat_yml, dict):
+			return None
+		missing = [key for key in ['max', 'ci_width'] if key not in repeat_yml]
+		if missing:
+			raise RuntimeError("Adaptive repetitions of experiment '{}' require the key(s) {}".format(
+					self.name, ', '.join("'{}'".format(key) for key in missing)))
+		settings = {
+			'min': repeat_yml.get('min', 2),
+			'max': repeat_yml['max'],
+			'ci_width': float(repeat_yml['ci_width']),
+			'metric': repeat_yml.get('metric', 'walltime')
+		}
+		if settings['min'] < 1 or settings['max'] < settings['min']:
+			raise RuntimeError("Invalid adaptive repetition settings for experiment '{}'".format(self.name))
+		return settings
+
 class Experiment:
 	"""
 	Represents an experiment (see below).
@@ -919,26 +1112,38 @@ class Run:
 		return os.path.join(self.experiment.output_subdir,
 				get_output_file_name(ext, self.instance.shortname, self.repetition))
 
-	def get_status(self):
-		if os.access(self.output_file_path('status'), os.F_OK):
-			with open(self.output_file_path('status'), "r") as f:
-				status_dict = yaml.load(f, Loader=yaml.Loader)
+	def read_status_dict(self):
+		"""Returns the contents of the run's status file or None if the run did not finish."""
+		try:
+			f = open(self.output_file_path('status'), "r")
+		except FileNotFoundError:
+			return None
+		with f:
+			return util.read_data_file(f)
 
+	def get_status_info(self):
+		"""Returns a pair (status, status_dict); status_dict is None for unfinished runs."""
+		status_dict = self.read_status_dict()
+		if status_dict is not None:
 			if status_dict['timeout']:
-				return Status.TIMEOUT
+				return (Status.TIMEOUT, status_dict)
 			elif status_dict['signal']:
-				return Status.KILLED
+				return (Status.KILLED, status_dict)
 			elif status_dict['status'] > 0:
-				return Status.FAILED
-			return Status.FINISHED
+				return (Status.FAILED, status_dict)
+			return (Status.FINISHED, status_dict)
 		elif os.access(self.output_file_path('out'), os.F_OK):
-			return Status.STARTED
+			return (Status.STARTED, None)
 		elif os.access(self.aux_file_path('run'), os.F_OK):
-			return Status.SUBMITTED
+			return (Status.SUBMITTED, None)
 		elif os.access(self.aux_file_path('lock'), os.F_OK):
-			return Status.IN_SUBMISSION
+			return (Status.IN_SUBMISSION, None)
+
+		return (Status.NOT_SUBMITTED, None)
 
-		return Status.NOT_SUBMITTED
+	def get_status(self):
+		with profiling.span('status scanning'):
+			return self.get_status_info()[0]
 
 def read_and_validate_setup(basedir='.', setup_file='experiments.yml'):
 	return util.validate_setup_file(os.path.join(basedir, setup_file))
@@ -946,6 +1151,7 @@ def read_and_validate_setup(basedir='.', setup_file='experiments.yml'):
 def config_for_dir(basedir=None):
 	if basedir is None:
 		basedir = '.'
-	yml = read_and_validate_setup(basedir=basedir)
-	return Config(os.path.abspath(basedir), yml)
+	with profiling.span('config loading'):
+		yml = read_and_validate_setup(basedir=basedir)
+		return Config(os.path.abspath(basedir), yml)
 
@@ -1,17 +1,189 @@
 
+import contextlib
 from enum import Enum, IntEnum
+import hashlib
+import json
 import os.path
 import subprocess
+import time
 
 from . import util
 
-def make_builds(cfg, revision, infos, wanted_builds, wanted_phases):
+def make_builds(cfg, revision, infos, wanted_builds, wanted_phases, parallel_builds=1,
+		parallelism=None, log_output=False, use_cache=False, incremental=False):
 	order = compute_order(cfg, infos)
 
 	print("simexpal: Making builds {} @ {}".format(', '.join([info.name for info in order]),
 			revision.name))
-	for info in order:
-		make_build_in_order(cfg, cfg.get_build(info.name, revision), wanted_builds, wanted_phases)
+	if parallel_builds > 1:
+		make_builds_concurrently(cfg, revision, order, wanted_builds, wanted_phases,
+				parallel_builds, parallelism=parallelism, use_cache=use_cache,
+				incremental=incremental)
+	else:
+		for info in order:
+			build = cfg.get_build(info.name, revision)
+			output = None
+			if log_output:
+				output = BuildOutput(prefix=build.name + '@' + revision.name, log_path=build.log_file)
+			make_build_in_order(cfg, build, wanted_builds, wanted_phases,
+					parallelism=parallelism, output=output, use_cache=use_cache,
+					incremental=incremental)
+
+def _make_revision_in_worker(basedir, revision_name, parallel_builds, parallelism, use_cache):
+	from . import base
+
+	cfg = base.config_for_dir(basedir)
+	revision = cfg.get_revision(revision_name)
+	make_builds(cfg, revision, [build.info for build in cfg.all_builds_for_revision(revision)], [], [],
+			parallel_builds=parallel_builds, parallelism=parallelism, log_output=True,
+			use_cache=use_cache)
+
+def make_revisions_concurrently(cfg, revisions, max_revisions, parallel_builds=1, cores=None,
+		use_cache=False):
+	"""
+	Builds multiple revisions in parallel worker processes.
+	The core budget (default: all available CPUs) is split evenly between the workers.
+	Failures do not abort other revisions; they are reported once all workers are done.
+	"""
+	import concurrent.futures
+
+	revisions = list(revisions)
+	if cores is None:
+		cores = get_concurrency()
+	num_workers = max(1, min(max_revisions, len(revisions)))
+	share = max(1, cores // num_workers)
+
+	failures = []
+	with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+		futures = {}
+		for revision in revisions:
+			future = executor.submit(_make_revision_in_worker, cfg.basedir, revision.name,
+					parallel_builds, share, use_cache)
+			futures[future] = revision
+
+		for future in concurrent.futures.as_completed(futures):
+			revision = futures[future]
+			error = future.exception()
+			if error is not None:
+				print("simexpal: Building revision {} failed: {}".format(revision.name, error))
+				failures.append((revision, error))
+			else:
+				print("simexpal: Finished building revision {}".format(revision.name))
+
+	if failures:
+		print("simexpal: The following revisions failed to build:")
+		for (revision, error) in failures:
+			print("    {}: {}".format(revision.name, error))
+			for build in cfg.all_builds_for_revision(revision):
+				if not build.is_installed() and os.access(build.log_file, os.F_OK):
+					print("        {}@{} (log: {})".format(build.name, revision.name, build.log_file))
+		raise RuntimeError("Failed to build {} revision(s)".format(len(failures)))
+
+def num_allocated_cpus():
+	try:
+		cpuset = os.sched_getaffinity(0)
+	except AttributeError:
+		# MacOS does not have CPU affinity.
+		return None
+	return len(cpuset)
+
+def get_concurrency():
+	n = num_allocated_cpus()
+	if n is None:
+		# The best that we can do is returning the number of all CPUs.
+		n = os.cpu_count()
+	return n
+
+# Runs builds (given in topological order) concurrently.
+# A build is started as soon as all of its requirements are installed.
+# The available CPUs are split between the builds that run at the same time.
+def make_builds_concurrently(cfg, revision, order, wanted_builds, wanted_phases, max_builds,
+		parallelism=None, use_cache=False, incremental=False):
+	import concurrent.futures
+
+	if parallelism is None:
+		parallelism = get_concurrency()
+
+	pending = list(order)
+	done = set()
+	running = {}
+	failures = []
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_builds) as executor:
+		while pending or running:
+			if not failures:
+				ready = [info for info in pending
+						if all(req_name in done for req_name in info.requirements)]
+				num_concurrent = min(max_builds, len(running) + len(ready))
+				share = max(1, parallelism // max(1, num_concurrent))
+
+				for info in ready[:max_builds - len(running)]:
+					pending.remove(info)
+					build = cfg.get_build(info.name, revision)
+					output = BuildOutput(prefix=build.name + '@' + revision.name,
+							log_path=build.log_file)
+					print("simexpal: Starting build {} @ {} with parallelism {} (log: {})".format(
+							build.name, revision.name, share, build.log_file))
+					future = executor.submit(make_build_in_order, cfg, build, wanted_builds,
+							wanted_phases, parallelism=share, output=output, use_cache=use_cache,
+							incremental=incremental)
+					running[future] = build
+			elif not running:
+				break
+
+			assert running
+			(finished, _) = concurrent.futures.wait(running,
+					return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in finished:
+				build = running.pop(future)
+				error = future.exception()
+				if error is not None:
+					print("simexpal: Build {} @ {} failed: {}".format(build.name, revision.name, error))
+					failures.append(build)
+				else:
+					done.add(build.name)
+
+	if failures:
+		raise RuntimeError("Builds failed: {} (see {})".format(
+				', '.join([build.name + '@' + revision.name for build in failures]),
+				', '.join([build.log_file for build in failures])))
+
+class BuildOutput:
+	"""
+	Determines where the output of a build goes. By default, messages are printed and
+	build steps inherit stdout/stderr. Otherwise, messages are prefixed and
+	the output of build steps is redirected to a log file.
+	"""
+
+	def __init__(self, prefix=None, log_path=None):
+		self.prefix = prefix
+		self.log_path = log_path
+		self._log = None
+
+	def __enter__(self):
+		if self.log_path is not None:
+			util.try_mkdir(os.path.dirname(self.log_path))
+			self._log = open(self.log_path, 'w')
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self._log is not None:
+			self._log.close()
+			self._log = None
+
+	def message(self, msg):
+		if self.prefix is not None:
+			print("[{}] {}".format(self.prefix, msg))
+		else:
+			print(msg)
+		if self._log is not None:
+			self._log.write(msg + '\n')
+			self._log.flush()
+
+	def check_call(self, args, **kwargs):
+		if self._log is None:
+			return subprocess.check_call(args, **kwargs)
+		return subprocess.check_call(args, stdout=self._log, stderr=subprocess.STDOUT, **kwargs)
 
 def compute_order(cfg, desired):
 	class State(Enum):
@@ -65,7 +237,548 @@ class Phase(IntEnum):
 	COMPILE = 4
 	INSTALL = 5
 
-def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
+def _get_revision_tag(revision):
+	return 'refs/tags/simexpal-rev/' + revision.name
+
+def _init_repo(build, output):
+	# Create the repository (in an empty state).
+	if not os.access(build.repo_dir, os.F_OK):
+		output.check_call(['git', 'init', '-q', '--bare', build.repo_dir])
+
+def _is_shallow_repo(repo_dir):
+	return os.access(os.path.join(repo_dir, 'shallow'), os.F_OK)
+
+def _list_refs(repo_dir):
+	if not os.access(repo_dir, os.F_OK):
+		return set()
+	return set(subprocess.check_output(['git', '--git-dir', repo_dir,
+			'for-each-ref', '--format=%(refname)']).decode().split())
+
+def _find_local_commits(repo_dir, versions):
+	"""Returns the subset of versions that are (full) IDs of commits in the repository."""
+	candidates = [version for version in versions
+			if len(version) == 40 and all(c in '0123456789abcdef' for c in version)]
+	if not candidates:
+		return set()
+	out = subprocess.run(['git', '--git-dir', repo_dir, 'cat-file', '--batch-check'],
+			input='\n'.join(candidates).encode() + b'\n',
+			stdout=subprocess.PIPE, check=True).stdout.decode()
+	return {line.split()[0] for line in out.splitlines() if line.split()[1:2] == ['commit']}
+
+def _get_unfetched_builds(builds, refs):
+	return [build for build in builds if _get_revision_tag(build.revision) not in refs]
+
+# Fetches the git refs of multiple revisions of the same (non-dev) build into the build's
+# repository using a single git fetch. Revisions that were fetched before are skipped;
+# commits that are already available locally are tagged without fetching.
+# The caller needs to hold the repository's lock.
+def fetch_builds(builds, output):
+	assert builds
+	assert all(build.name == builds[0].name for build in builds)
+	repo_dir = builds[0].repo_dir
+	_init_repo(builds[0], output)
+
+	refs = _list_refs(repo_dir)
+	pending = _get_unfetched_builds(builds, refs)
+	local_commits = _find_local_commits(repo_dir,
+			[build.revision.version_for_build(build.name) for build in pending])
+
+	# Fetch the remote refs to local tags.
+	# TODO: If we *know* that the ref is a tag, we want to fetch refs/tags/<ref> instead.
+	fetch_refspecs = []
+	for build in pending:
+		generic_tag = _get_revision_tag(build.revision)
+		version = build.revision.version_for_build(build.name)
+		if version in local_commits:
+			output.check_call(['git', '--git-dir', repo_dir, 'update-ref', generic_tag, version])
+			continue
+		refspec = '+' + version + ':' + generic_tag
+		if refspec not in fetch_refspecs:
+			fetch_refspecs.append(refspec)
+	if not fetch_refspecs:
+		return
+
+	# Only fetch the history that is needed, i.e., fetch shallowly unless the repository
+	# already has the full history (from a dev-build clone). In that case, --depth would
+	# make it shallow again while a full fetch only transfers the missing objects.
+	depth = []
+	if not refs or _is_shallow_repo(repo_dir):
+		depth = ['--depth=1']
+
+	# As we create the tags, we can add --no-tags here.
+	output.check_call(['git', '--git-dir', repo_dir,
+			'fetch'] + depth + ['--no-tags',
+			builds[0].info.git_repo] + fetch_refspecs)
+
+# Fetches the git ref of a (non-dev) build (unless it was fetched before)
+# and returns the local tag that refers to it.
+# The caller needs to hold the repository's lock.
+def fetch_build_revision(build, output):
+	fetch_builds([build], output)
+	return _get_revision_tag(build.revision)
+
+def fetch_revisions(cfg, revisions, max_fetches=4):
+	"""
+	Fetches the git refs of all builds of the given revisions that are not installed yet.
+	All refs of the same build are fetched by a single git fetch; different builds
+	are fetched concurrently.
+	"""
+	import concurrent.futures
+
+	plan = {}
+	for revision in revisions:
+		if revision.is_dev_build:
+			continue
+		for build in cfg.all_builds_for_revision(revision):
+			if not build.is_installed():
+				plan.setdefault(build.name, []).append(build)
+
+	# Skip builds whose refs were all fetched before.
+	for (name, builds) in list(plan.items()):
+		builds = _get_unfetched_builds(builds, _list_refs(builds[0].repo_dir))
+		if builds:
+			plan[name] = builds
+		else:
+			del plan[name]
+	if not plan:
+		return
+	util.try_mkdir(os.path.join(cfg.basedir, 'builds'))
+
+	def fetch(builds):
+		with util.locked_file(builds[0].repo_dir + '.lock'):
+			fetch_builds(builds, BuildOutput())
+
+	print("simexpal: Fetching {}".format(', '.join(
+			'{} @ {}'.format(name, ', '.join([build.revision.name for build in builds]))
+			for (name, builds) in plan.items())))
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_fetches) as executor:
+		futures = {executor.submit(fetch, builds): name for (name, builds) in plan.items()}
+		failures = []
+		for future in concurrent.futures.as_completed(futures):
+			error = future.exception()
+			if error is not None:
+				print("simexpal: Fetching {} failed: {}".format(futures[future], error))
+				failures.append(futures[future])
+	if failures:
+		raise RuntimeError("Failed to fetch builds: {}".format(', '.join(failures)))
+
+# ---------------------------------------------------------------------------------------
+# Build cache.
+# Installed (non-dev) builds are identified by a key that hashes the checked out commit,
+# the build's stanza in experiments.yml and the keys of all required builds.
+# builds/_cache/<key> holds a copy of the prefix directory of the build that was installed
+# first (made of hard links where possible); its origin.simexpal names that prefix
+# directory. Other builds with the same key copy the entry into their own prefix directory
+# (including origin.simexpal), such that they survive rebuilds of the original build.
+# However, installed files can contain the absolute path of the original prefix directory
+# (e.g., RPATHs, pkg-config or CMake package files). Hence, entries are only used while the
+# original build is installed, and reused builds are made again once it is removed.
+# Builds whose compile directory is referenced by other builds (@COMPILE_DIR_FOR:...@)
+# are never reused.
+# ---------------------------------------------------------------------------------------
+
+def _get_cache_dir(cfg):
+	return os.path.join(cfg.basedir, 'builds', '_cache')
+
+def compute_cache_key(cfg, build, commit):
+	"""Returns the cache key of a build or None if it cannot be cached."""
+	req_keys = []
+	for req_name in build.info.requirements:
+		req_build = cfg.get_build(req_name, build.revision)
+		req_key = util.read_file(os.path.join(req_build.prefix_dir, 'cachekey.simexpal')).strip()
+		if not req_key:
+			return None
+		req_keys.append([req_name, req_key])
+
+	key_yml = {
+		'commit': commit,
+		'build': build.info._build_yml,
+		'requires': sorted(req_keys)
+	}
+	return hashlib.sha256(json.dumps(key_yml, sort_keys=True, default=str).encode()).hexdigest()
+
+def _read_origin(prefix_dir):
+	"""Returns the prefix directory that a cached copy was made from (or None)."""
+	origin = util.read_file(os.path.join(prefix_dir, 'origin.simexpal')).strip()
+	return origin or None
+
+def _is_origin_installed(origin):
+	return os.access(os.path.join(origin, 'installed.simexpal'), os.F_OK)
+
+def _is_compile_dir_needed(cfg, build):
+	# Other builds can refer to the compile directory of this build in their steps.
+	ref = '@COMPILE_DIR_FOR:{}@'.format(build.name)
+	return any(ref in json.dumps(cfg.get_build_info(name)._build_yml, default=str)
+			for name in cfg._build_infos)
+
+def _is_usable_entry(entry):
+	if os.path.islink(entry) or not os.access(os.path.join(entry, 'installed.simexpal'), os.F_OK):
+		return False # Incomplete entry or entry of an older version of simexpal.
+	origin = _read_origin(entry)
+	return origin is not None and _is_origin_installed(origin)
+
+def _copy_prefix(src, dst, origin=None):
+	# Copy to a temporary directory first such that dst is never incomplete.
+	tmp_dst = '{}.tmp-{}'.format(dst, os.getpid())
+	util.try_rmtree(tmp_dst)
+	util.link_tree(src, tmp_dst)
+	if origin is not None:
+		with open(os.path.join(tmp_dst, 'origin.simexpal'), 'w') as f:
+			f.write(origin + '\n')
+	try:
+		os.rename(tmp_dst, dst)
+	except OSError:
+		util.try_rmtree(tmp_dst)
+		raise
+
+def _register_cached_build(cfg, build):
+	commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+			cwd=build.clone_dir).decode().strip()
+	key = compute_cache_key(cfg, build, commit)
+	if key is None:
+		return
+
+	with open(os.path.join(build.prefix_dir, 'cachekey.simexpal'), 'w') as f:
+		f.write(key + '\n')
+
+	cache_dir = _get_cache_dir(cfg)
+	util.try_mkdir(cache_dir)
+	entry = os.path.join(cache_dir, key)
+	with util.locked_file(entry + '.lock'):
+		if _is_usable_entry(entry):
+			return
+		# Replace incomplete entries and entries whose original build was removed.
+		if os.path.islink(entry):
+			os.unlink(entry)
+		util.try_rmtree(entry)
+		_copy_prefix(build.prefix_dir, entry, origin=build.prefix_dir)
+
+def _reuse_cached_build(cfg, build, output):
+	if _is_compile_dir_needed(cfg, build):
+		return False
+
+	with util.locked_file(build.repo_dir + '.lock'):
+		generic_tag = fetch_build_revision(build, output)
+	commit = subprocess.check_output(['git', '--git-dir', build.repo_dir,
+			'rev-parse', generic_tag + '^{commit}']).decode().strip()
+	key = compute_cache_key(cfg, build, commit)
+	if key is None:
+		return False
+
+	entry = os.path.join(_get_cache_dir(cfg), key)
+	if not os.access(entry, os.F_OK):
+		return False
+	with util.locked_file(entry + '.lock'):
+		if not _is_usable_entry(entry) or _read_origin(entry) == build.prefix_dir:
+			return False
+
+		output.message("simexpal: Reusing build {} from {}".format(build.name, entry))
+		# Builds that were reused by older versions of simexpal link to another build.
+		for own_dir in [build.clone_dir, build.compile_dir]:
+			if os.path.islink(own_dir):
+				os.unlink(own_dir)
+		util.try_rmtree(build.compile_dir)
+		util.try_rmtree(build.prefix_dir)
+		_copy_prefix(entry, build.prefix_dir)
+	return True
+
+def _is_reused_build(build):
+	return (not build.revision.is_dev_build
+			and _read_origin(build.prefix_dir) not in [None, build.prefix_dir])
+
+def _check_reused_build(build, output):
+	# Reused builds can refer to files of the original build; make them again
+	# if the original build was removed.
+	if not _is_reused_build(build) or not build.is_installed():
+		return
+	origin = _read_origin(build.prefix_dir)
+	if _is_origin_installed(origin):
+		return
+	output.message("simexpal: Build {} was copied from {}, which was removed;"
+			" it is made again".format(build.name, origin))
+	os.unlink(os.path.join(build.prefix_dir, 'installed.simexpal'))
+
+# ---------------------------------------------------------------------------------------
+# Compiler cache.
+# ---------------------------------------------------------------------------------------
+
+def _get_compiler_cache_log(build):
+	return os.path.join(build.compile_dir, 'compiler-cache.log')
+
+def get_compiler_cache_source_link(build):
+	"""
+	Returns the path of the symlink to the source directory in the compile directory.
+	Build steps of builds that use a compiler cache refer to the sources through this link,
+	such that the sources have the same path relative to the compile directory
+	in all revisions.
+	"""
+	return os.path.join(build.compile_dir, 'source.simexpal')
+
+def get_compiler_cache_environ(cfg, build):
+	"""
+	Returns the environment variables that enable a ccache-compatible compiler cache
+	for the build steps of a build. All builds share the cache in builds/_ccache.
+	"""
+	launcher = build.info.compiler_cache
+	# Map the compile directory in the debug info (which is not hashed due to
+	# CCACHE_NOHASHDIR) such that objects from the cache do not refer to other revisions.
+	prefix_map = '-fdebug-prefix-map={}=.'.format(build.compile_dir)
+	def prepend_flags(var):
+		if var in os.environ:
+			return prefix_map + ' ' + os.environ[var]
+		return prefix_map
+
+	return {
+		'CCACHE_DIR': os.path.join(cfg.basedir, 'builds', '_ccache'),
+		# Paths below the compile directory (including the sources, which are referenced
+		# through get_compiler_cache_source_link()) are hashed relative to it and the
+		# working directory itself is not hashed. Hence, hits do not depend on the
+		# revision or on the location of the experiment directory.
+		'CCACHE_BASEDIR': build.compile_dir,
+		'CCACHE_NOHASHDIR': '1',
+		'CCACHE_STATSLOG': _get_compiler_cache_log(build),
+		'CFLAGS': prepend_flags('CFLAGS'),
+		'CXXFLAGS': prepend_flags('CXXFLAGS'),
+		# Honored by CMake >= 3.17.
+		'CMAKE_C_COMPILER_LAUNCHER': launcher,
+		'CMAKE_CXX_COMPILER_LAUNCHER': launcher
+	}
+
+def read_compiler_cache_stats(path):
+	"""
+	Returns a pair (hits, misses) that is computed from a ccache statistics log.
+	Each compilation appends a line '# <source file>', followed by its result counters.
+	"""
+	hits = 0
+	misses = 0
+	for line in util.read_file(path).splitlines():
+		if line.startswith('#'):
+			continue
+		if line.endswith('cache_hit') or line.startswith('cache_hit'):
+			hits += 1
+		elif line == 'cache_miss':
+			misses += 1
+	return (hits, misses)
+
+# ---------------------------------------------------------------------------------------
+# Change detection for dev-builds.
+# The fingerprint of a dev-build consists of the size, mtime and SHA-256 hash of all files
+# in its source directory, its build instructions and the install time of its requirements.
+# It is stored in the compile directory when the compile phase finishes.
+# ---------------------------------------------------------------------------------------
+
+def _get_fingerprint_path(build):
+	return os.path.join(build.compile_dir, 'fingerprint.simexpal')
+
+def read_fingerprint(build):
+	try:
+		with open(_get_fingerprint_path(build), 'r') as f:
+			return json.load(f)
+	except (FileNotFoundError, ValueError):
+		return None
+
+def write_fingerprint(build, fingerprint):
+	path = _get_fingerprint_path(build)
+	with open(path + '.tmp', 'w') as f:
+		json.dump(fingerprint, f)
+	os.rename(path + '.tmp', path)
+
+def compute_fingerprint(cfg, build, previous=None):
+	"""
+	Computes the fingerprint of a dev-build. Files whose size and mtime match
+	the previous fingerprint are not hashed again.
+	"""
+	previous_files = previous['files'] if previous is not None else {}
+
+	files = {}
+	for (dirpath, dirnames, filenames) in os.walk(build.source_dir):
+		if '.git' in dirnames:
+			dirnames.remove('.git')
+		for filename in filenames:
+			path = os.path.join(dirpath, filename)
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError: # Dangling symlink.
+				continue
+			rel_path = os.path.relpath(path, build.source_dir)
+
+			entry = previous_files.get(rel_path)
+			if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+				entry = [stat.st_size, stat.st_mtime_ns, util.hash_file(path)]
+			files[rel_path] = entry
+
+	requirements = {}
+	for req_name in build.info.requirements:
+		req_build = cfg.get_build(req_name, build.revision)
+		try:
+			requirements[req_name] = os.stat(
+					os.path.join(req_build.prefix_dir, 'installed.simexpal')).st_mtime_ns
+		except FileNotFoundError:
+			requirements[req_name] = None
+
+	return {
+		'build': json.loads(json.dumps(build.info._build_yml, sort_keys=True, default=str)),
+		'requirements': requirements,
+		'files': files
+	}
+
+def same_fingerprint(a, b):
+	"""Compares fingerprints by content, i.e., mtimes of files are ignored."""
+	if a is None or b is None:
+		return False
+	if a['build'] != b['build'] or a['requirements'] != b['requirements']:
+		return False
+	if a['files'].keys() != b['files'].keys():
+		return False
+	return all(a['files'][k][0] == b['files'][k][0] and a['files'][k][2] == b['files'][k][2]
+			for k in a['files'])
+
+# ---------------------------------------------------------------------------------------
+# Build timings.
+# The duration of each phase and each build step is appended as a JSON object
+# to builds/_timings.jsonl (one object per line).
+# ---------------------------------------------------------------------------------------
+
+PHASE_NAMES = ['checkout', 'regenerate', 'configure', 'compile', 'install']
+
+def get_timings_path(cfg):
+	return os.path.join(cfg.basedir, 'builds', '_timings.jsonl')
+
+class BuildTimer:
+	"""
+	Records the timings of the phases and steps of a build. A phase lasts until
+	the next phase starts or until the build finishes.
+	"""
+
+	def __init__(self, cfg, build):
+		self.cfg = cfg
+		self.build = build
+		self._phase = None
+		self._phase_start = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._finish_phase(exc_type is None)
+
+	def _record(self, phase, step, start, success):
+		record = {
+			'build': self.build.name,
+			'revision': self.build.revision.name,
+			'phase': phase,
+			'step': step,
+			'start': start,
+			'duration': time.time() - start,
+			'status': 'success' if success else 'failure'
+		}
+		path = get_timings_path(self.cfg)
+		util.try_mkdir(os.path.dirname(path))
+		# Each record is appended by a single write such that concurrent builds
+		# do not interleave their records.
+		with open(path, 'a') as f:
+			f.write(json.dumps(record) + '\n')
+
+	def _finish_phase(self, success):
+		if self._phase is not None:
+			self._record(self._phase, None, self._phase_start, success)
+		self._phase = None
+
+	def start_phase(self, phase):
+		self._finish_phase(True)
+		self._phase = phase
+		self._phase_start = time.time()
+
+	@contextlib.contextmanager
+	def step(self, args):
+		if not isinstance(args, str):
+			args = ' '.join(args)
+		start = time.time()
+		try:
+			yield
+		except BaseException:
+			self._record(self._phase, args, start, False)
+			raise
+		self._record(self._phase, args, start, True)
+
+def read_timings(cfg):
+	records = []
+	try:
+		f = open(get_timings_path(cfg), 'r')
+	except FileNotFoundError:
+		return records
+	with f:
+		for line in f:
+			try:
+				records.append(json.loads(line))
+			except ValueError: # Truncated by an interrupted build.
+				continue
+	return records
+
+def summarize_timings(cfg, records):
+	"""
+	Summarizes the most recent timings of each phase for all builds.
+	Returns a dict that maps revision names to dicts with keys
+	'builds' (maps build names to dicts {phase: duration}),
+	'steps' (maps triples (build, phase, step) to durations) and
+	'critical_path' (a pair of a list of build names and its total duration).
+	The critical path is the chain of requirements with the largest total duration;
+	it bounds the duration of the revision's build if builds are run concurrently.
+	"""
+	summary = {}
+	for record in records:
+		entry = summary.setdefault(record['revision'], {'builds': {}, 'steps': {}})
+		if record['step'] is not None:
+			entry['steps'][(record['build'], record['phase'], record['step'])] = record['duration']
+		else:
+			phases = entry['builds'].setdefault(record['build'], {})
+			phases[record['phase']] = record['duration']
+
+	for (revision_name, entry) in summary.items():
+		builds = entry['builds']
+		longest = {} # Maps build names to pairs (path, duration).
+
+		def visit(name):
+			if name in longest:
+				return longest[name]
+			best = ([], 0.0)
+			try:
+				requirements = list(cfg.get_build_info(name).requirements)
+			except RuntimeError: # The build was removed from experiments.yml.
+				requirements = []
+			for req_name in requirements:
+				candidate = visit(req_name)
+				if candidate[1] > best[1]:
+					best = candidate
+			duration = sum(builds.get(name, {}).values())
+			longest[name] = (best[0] + [name], best[1] + duration)
+			return longest[name]
+
+		critical_path = ([], 0.0)
+		for name in builds:
+			candidate = visit(name)
+			if candidate[1] > critical_path[1]:
+				critical_path = candidate
+		entry['critical_path'] = critical_path
+
+	return summary
+
+def make_build_in_order(cfg, build, wanted_builds, wanted_phases, parallelism=None, output=None,
+		use_cache=False, incremental=False):
+	"""
+	Runs all phases of a build that are wanted and not done yet.
+	In incremental mode, the compile and install phases of dev-builds are skipped if their
+	inputs did not change since the last compilation, and installs do not clear the
+	prefix directory.
+	"""
+	if output is None:
+		output = BuildOutput()
+	with output, BuildTimer(cfg, build) as timer:
+		_make_build_in_order(cfg, build, wanted_builds, wanted_phases, parallelism, output,
+				timer, use_cache, incremental)
+
+def _make_build_in_order(cfg, build, wanted_builds, wanted_phases, parallelism, output,
+		timer, use_cache, incremental):
 	if not build.revision.is_dev_build:
 		util.try_mkdir('builds/')
 		checkout_dir = build.clone_dir
@@ -74,21 +787,6 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 		util.try_mkdir('dev-builds/')
 		checkout_dir = build.source_dir
 
-	def num_allocated_cpus():
-		try:
-			cpuset = os.sched_getaffinity(0)
-		except AttributeError:
-			# MacOS does not have CPU affinity.
-			return None
-		return len(cpuset)
-
-	def get_concurrency():
-		n = num_allocated_cpus()
-		if n is None:
-			# The best that we can do is returning the number of all CPUs.
-			n = os.cpu_count()
-		return n
-
 	def get_source_dir_for(build_name):
 		other_build = cfg.get_build(build_name, build.revision)
 		if not other_build.revision.is_dev_build:
@@ -106,6 +804,9 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 	def substitute(var):
 		# 'THIS_SOURCE_DIR' is prefered, 'THIS_CLONE_DIR' is deprecated
 		if var in ['THIS_CLONE_DIR', 'THIS_SOURCE_DIR']:
+			source_link = get_compiler_cache_source_link(build)
+			if build.info.compiler_cache and os.path.lexists(source_link):
+				return source_link
 			if not build.revision.is_dev_build:
 				return build.clone_dir
 			else:
@@ -120,7 +821,11 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 			return get_compile_dir_for(var.split(':')[1])
 		elif var.startswith('PREFIX_DIR_FOR:'):
 			return get_prefix_dir_for(var.split(':')[1])
+		elif var == 'COMPILER_CACHE':
+			return build.info.compiler_cache or ''
 		elif var == 'PARALLELISM':
+			if parallelism is not None:
+				return str(parallelism)
 			return str(get_concurrency())
 
 	# Build the environment.
@@ -139,10 +844,14 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 
 	base_environ = os.environ.copy()
 	base_environ['PKG_CONFIG_PATH'] = prepend_env('PKG_CONFIG_PATH', pkgconfig_paths)
+	if build.info.compiler_cache:
+		base_environ.update(get_compiler_cache_environ(cfg, build))
 
 	def skip_phase(phase):
 		return phase > max(wanted_phases)
 
+	_check_reused_build(build, output)
+
 	done_phases = set()
 	if build.name in wanted_builds:
 		if (build.is_installed() or skip_phase(Phase.INSTALL)) and Phase.INSTALL not in wanted_phases:
@@ -167,6 +876,13 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 		if build.is_checked_out():
 			done_phases.add(Phase.CHECKOUT)
 
+	# Reused builds are installed without being configured and compiled (their
+	# compile directory does not exist). Only compile them if this is requested.
+	if _is_reused_build(build) and build.is_installed():
+		for phase in [Phase.CONFIGURE, Phase.COMPILE]:
+			if build.name not in wanted_builds or phase not in wanted_phases:
+				done_phases.add(phase)
+
 	def want_phase(phase):
 		# TODO: Support additional phase section modes. For example:
 		#       - Clean rebuilds from scratch. This should be prefered for production use.
@@ -174,7 +890,8 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 
 	# Perform the actual build phases.
 	def log_phase(step):
-		print("simexpal: Running {}-phase for build {}".format(step, build.name))
+		output.message("simexpal: Running {}-phase for build {}".format(step, build.name))
+		timer.start_phase(step)
 
 	did_work = False
 
@@ -196,59 +913,79 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 			shell = True
 			args = util.expand_at_params(step_yml['args'], substitute)
 
-		subprocess.check_call(args, cwd=workdir, env=environ, shell=shell)
+		with timer.step(args):
+			output.check_call(args, cwd=workdir, env=environ, shell=shell)
+
+	if (use_cache and not build.revision.is_dev_build and want_phase(Phase.INSTALL)
+			and _reuse_cached_build(cfg, build, output)):
+		# The build still gets its own checkout (e.g., for @SOURCE_DIR_FOR@ of other builds).
+		done_phases.update([Phase.CONFIGURE, Phase.COMPILE, Phase.INSTALL])
+		if not build.is_checked_out():
+			done_phases.discard(Phase.CHECKOUT)
+		if not build.is_regenerated():
+			done_phases.discard(Phase.REGENERATE)
+		did_work = True
 
 	if want_phase(Phase.CHECKOUT):
 		log_phase('checkout')
 
 		if not build.revision.is_dev_build:
+			# The repository is shared by all revisions of the build;
+			# lock it as other revisions might be built concurrently.
+			with util.locked_file(build.repo_dir + '.lock'):
+				generic_tag = fetch_build_revision(build, output)
+
+				# Prune the existing worktree (if any).
+				if (os.path.lexists(build.clone_dir)
+						or os.access(os.path.join(build.repo_dir, 'worktrees',
+							os.path.basename(build.clone_dir)), os.F_OK)):
+					util.try_rmtree(build.clone_dir)
+					output.check_call(['git', '--git-dir', build.repo_dir,
+							'worktree', 'prune'])
 
-			git_ref = build.revision.version_for_build(build.name)
-			generic_tag = 'refs/tags/simexpal-rev/' + build.revision.name
-
-			# Fetch the remote ref to a local tag.
-			fetch_refspec = ['+' + git_ref + ':' + generic_tag]
-
-			# TODO: If we *know* that the ref is a tag, we want to do something like the following:
-			#fetch_refspec = ['+refs/tags/' + git_ref + ':' + generic_tag]
-
-			# Create the repository (in an empty state).
-			if not os.access(build.repo_dir, os.F_OK):
-				subprocess.check_call(['git', 'init', '-q', '--bare', build.repo_dir])
-
-			# Fetch the specified revision if it does not exist already.
-			verify_ref_result = subprocess.call(['git', '--git-dir', build.repo_dir,
-					'rev-parse', '-q', '--verify', generic_tag],
-				stdout=subprocess.DEVNULL)
-			if verify_ref_result != 0:
-				# As we create generic_tag, we can add --no-tags here.
-				subprocess.check_call(['git', '--git-dir', build.repo_dir,
-						'fetch', '--depth=1', '--no-tags',
-						build.info.git_repo] + fetch_refspec)
-
-			# Prune the existing worktree.
-			util.try_rmtree(build.clone_dir)
-			subprocess.check_call(['git', '--git-dir', build.repo_dir,
-					'worktree', 'prune'])
-
-			# Recreate the worktree and check out the specified revision.
-			subprocess.check_call(['git', '--git-dir', build.repo_dir,
-					'worktree', 'add', '--detach',
-					build.clone_dir,
-					generic_tag])
+				# Recreate the worktree and check out the specified revision.
+				output.check_call(['git', '--git-dir', build.repo_dir,
+						'worktree', 'add', '-q', '--detach',
+						build.clone_dir,
+						generic_tag])
 		else:
 			# Recreate the source directory
 			util.try_rmtree(build.source_dir)
 			util.try_mkdir(build.source_dir)
 
-			# Clone the git repository into the build.source_dir
-			subprocess.check_call(['git', 'clone', build.info.git_repo, build.source_dir])
+			# Clone the git repository into the build.source_dir.
+			# The shared repository is used as a reference to avoid transferring objects
+			# that are already available locally. git ignores shallow references; in this
+			# case, we clone without a reference.
+			with util.locked_file(build.repo_dir + '.lock'):
+				_init_repo(build, output)
+				reference = []
+				if _list_refs(build.repo_dir) and not _is_shallow_repo(build.repo_dir):
+					reference = ['--reference', build.repo_dir, '--dissociate']
+				output.check_call(['git', 'clone'] + reference + [build.info.git_repo,
+						build.source_dir])
+
+				# Store the history in the shared repository such that later clones (and
+				# fetches of other revisions) only transfer new objects. This fetch is local.
+				unshallow = []
+				if _is_shallow_repo(build.repo_dir):
+					unshallow = ['--unshallow']
+				dev_refspec = '+refs/remotes/origin/*:refs/simexpal-dev/heads/*'
+				try:
+					output.check_call(['git', '--git-dir', build.repo_dir,
+							'fetch', '-q', '--no-tags'] + unshallow + [build.source_dir, dev_refspec])
+				except subprocess.CalledProcessError:
+					if not unshallow:
+						raise
+					# Some shallow commits are not reachable from the branches of the clone.
+					output.check_call(['git', '--git-dir', build.repo_dir,
+							'fetch', '-q', '--no-tags', build.source_dir, dev_refspec])
 
 		util.touch(os.path.join(checkout_dir, 'checkedout.simexpal'))
 
 		if build.info.recursive_clone:
 			# Clone submodules recursively
-			subprocess.check_call(['git', 'submodule',
+			output.check_call(['git', 'submodule',
 					'update', '--init', '--recursive'], cwd=checkout_dir)
 
 		did_work = True
@@ -268,6 +1005,8 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 		# Recreate the compilation directory.
 		util.try_rmtree(build.compile_dir)
 		util.try_mkdir(build.compile_dir)
+		if build.info.compiler_cache:
+			os.symlink(checkout_dir, get_compiler_cache_source_link(build))
 
 		configure_args = util.ensure_list_type(build.info.configure)
 		for step_yml in configure_args:
@@ -275,28 +1014,57 @@ def make_build_in_order(cfg, build, wanted_builds, wanted_phases):
 		util.touch(os.path.join(build.compile_dir, 'configured.simexpal'))
 		did_work = True
 
+	fingerprint = None
+	if build.revision.is_dev_build and want_phase(Phase.COMPILE):
+		previous_fingerprint = read_fingerprint(build)
+		fingerprint = compute_fingerprint(cfg, build, previous_fingerprint)
+		if (incremental and build.is_compiled()
+				and same_fingerprint(previous_fingerprint, fingerprint)):
+			output.message("simexpal: Inputs of build {} are unchanged, skipping compile".format(
+					build.name))
+			done_phases.add(Phase.COMPILE)
+			if build.is_installed():
+				done_phases.add(Phase.INSTALL)
+			did_work = True
+
 	if want_phase(Phase.COMPILE):
 		log_phase('compile')
 
+		if build.info.compiler_cache:
+			util.try_rmfile(_get_compiler_cache_log(build))
+
 		compile_args = util.ensure_list_type(build.info.compile)
 		for step_yml in compile_args:
 			do_step(step_yml, default_workdir=build.compile_dir)
+
+		if build.info.compiler_cache:
+			(hits, misses) = read_compiler_cache_stats(_get_compiler_cache_log(build))
+			output.message("simexpal: Compiler cache for {}: {} hits, {} misses".format(
+					build.name, hits, misses))
 		util.touch(os.path.join(build.compile_dir, 'compiled.simexpal'))
+		if fingerprint is not None:
+			write_fingerprint(build, fingerprint)
 		did_work = True
 
 	if want_phase(Phase.INSTALL):
 		log_phase('install')
 
-		# Recreate the prefix directory.
-		util.try_rmtree(build.prefix_dir)
+		if incremental and build.revision.is_dev_build:
+			# Install over the existing prefix directory.
+			util.try_rmfile(os.path.join(build.prefix_dir, 'installed.simexpal'))
+		else:
+			# Recreate the prefix directory.
+			util.try_rmtree(build.prefix_dir)
 		util.try_mkdir(build.prefix_dir)
 
 		install_args = util.ensure_list_type(build.info.install)
 		for step_yml in install_args:
 			do_step(step_yml, default_workdir=build.compile_dir)
 		util.touch(os.path.join(build.prefix_dir, 'installed.simexpal'))
+		if not build.revision.is_dev_build:
+			_register_cached_build(cfg, build)
 		did_work = True
 
 	if not did_work:
-		print("simexpal: Nothing to do for {}".format(build.name))
+		output.message("simexpal: Nothing to do for {}".format(build.name))
 
@@ -1,12 +1,11 @@
 import errno
-import gzip
+import io
 import os
-import requests
+import re
 import shutil
-import tarfile
-import yaml
-import zipfile
+import struct
 
+from . import util
 from .util import try_mkdir
 
 class DownloadException(Exception):
@@ -27,7 +26,76 @@ repos = {
 	}
 }
 
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+def _get_total_size(response):
+	# The total size is sent in the Content-Range header of 206 and 416 responses.
+	content_range = response.headers.get('Content-Range', '')
+	total = content_range.rpartition('/')[2]
+	if total.isdigit():
+		return int(total)
+	return None
+
+def _get_content_length(response):
+	# Content-Length refers to the encoded body; requests decodes Content-Encoding.
+	length = response.headers.get('Content-Length', '')
+	if not length.isdigit() or 'Content-Encoding' in response.headers:
+		return None
+	return int(length)
+
+# Downloads a file in chunks. If the file was partially downloaded before,
+# the download is resumed using an HTTP range request.
+# Raises a DownloadException if the size of the file does not match the size that
+# the server announced (e.g., if the connection was closed early).
+def download_file(url, path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+	import requests
+
+	offset = 0
+	try:
+		offset = os.path.getsize(path)
+	except FileNotFoundError:
+		pass
+
+	headers = {}
+	if offset:
+		headers['Range'] = 'bytes={}-'.format(offset)
+	with requests.get(url, headers=headers, stream=True) as response:
+		if offset and response.status_code == 416:
+			# Range Not Satisfiable: the file might be complete already. This is only
+			# accepted if its size matches the size of the remote file.
+			total = _get_total_size(response)
+			if total is None:
+				head_response = requests.head(url, allow_redirects=True)
+				if head_response.ok:
+					total = _get_content_length(head_response)
+			if total == offset:
+				return
+			# The partial file does not belong to the remote file; start over.
+			os.unlink(path)
+			download_file(url, path, chunk_size)
+			return
+		response.raise_for_status()
+		if response.status_code == 206:
+			expected_size = _get_total_size(response)
+		else:
+			offset = 0 # The server does not support range requests.
+			expected_size = _get_content_length(response)
+
+		with open(path, 'ab' if offset else 'wb') as f:
+			for chunk in response.iter_content(chunk_size=chunk_size):
+				f.write(chunk)
+
+	# Keep the partial file such that the next attempt can resume the download.
+	size = os.path.getsize(path)
+	if expected_size is not None and size != expected_size:
+		raise DownloadException("Incomplete download of {}: got {} of {} bytes".format(
+				url, size, expected_size))
+
 def download_instance(inst_yml, instances_dir, filename, partial_path, ext):
+	import gzip
+	import tarfile
+	import zipfile
+
 	repo = inst_yml['repo']
 
 	try_mkdir(instances_dir)
@@ -40,23 +108,22 @@ def download_instance(inst_yml, instances_dir, filename, partial_path, ext):
 	url = repos[repo]['url'] + prefix + filename + fmt
 
 	download_path = os.path.join(instances_dir, filename + '.download')
-	request = requests.get(url)
-	with open(download_path, 'wb') as f:
-		f.write(request.content)
+	download_file(url, download_path)
 
-	# Decompress the instance.
+	# Decompress the instance. All archives are read as streams,
+	# i.e., they are never held in memory as a whole.
 	def extract(reader, f):
-		f.write(reader.read())
+		shutil.copyfileobj(reader, f, DOWNLOAD_CHUNK_SIZE)
 
 	tmp_path = os.path.join(instances_dir, filename + '.tmp')
 	compression = fmt.split('.')[-1]
 	if repo == 'konect':
-		tar = tarfile.open(download_path, 'r:' + compression)
-		member_name = next(elem for elem in tar.getnames() if 'out.' in elem)
+		with tarfile.open(download_path, 'r|' + compression) as tar:
+			member = next(elem for elem in tar if 'out.' in elem.name)
 
-		with tar.extractfile(member_name) as reader:
-			with open(tmp_path, 'wb') as f:
-				extract(reader, f)
+			with tar.extractfile(member) as reader:
+				with open(tmp_path, 'wb') as f:
+					extract(reader, f)
 	elif repo == 'snap':
 		with gzip.open(download_path, 'rb') as reader:
 			with open(tmp_path, 'wb') as f:
@@ -65,38 +132,796 @@ def download_instance(inst_yml, instances_dir, filename, partial_path, ext):
 		zip_file = zipfile.ZipFile(download_path + compression, 'r')
 		# TODO finish
 	else:
-		DownloadException('Unknown repository: ' + repo)
+		raise DownloadException('Unknown repository: ' + repo)
 
 	os.unlink(download_path)
 	os.rename(tmp_path, partial_path + ext)
 
-# Reformats the network to a SNAP/EdgeList format.
-def convert_to_edgelist(inst_yml, in_path, out_path):
+def get_generator_command(inst_yml, filename):
+	def substitute(p):
+		if p == 'INSTANCE_FILENAME':
+			return filename
+		raise RuntimeError("Unexpected parameter {}".format(p))
+
+	assert isinstance(inst_yml['generator']['args'], list)
+	return [util.expand_at_params(arg_tmpl, substitute) for arg_tmpl
+			in inst_yml['generator']['args']]
+
+def get_generator_key(basedir, cmd, filename, postprocess=None):
+	"""
+	Identifies the output of a generator (after postprocessing). Generators are expected
+	to be deterministic, i.e., the same command (executed in the same directory) always
+	yields the same instance.
+	"""
+	import hashlib
+	import json
+
+	digest = hashlib.sha256(json.dumps({
+		'basedir': basedir,
+		'args': cmd,
+		'filename': filename,
+		'postprocess': postprocess
+	}, sort_keys=True).encode()).hexdigest()
+	return filename + '-' + digest[:16]
+
+def run_generator(cmd, out_path, cwd):
+	import subprocess
+
+	with open(out_path + '.gen', 'w') as f:
+		# Use run() instead of check_call() such that stderr is actually consumed.
+		proc = subprocess.run(cmd, cwd=cwd,
+				stdout=f, stderr=subprocess.PIPE)
+	if proc.returncode != 0:
+		util.try_rmfile(out_path + '.gen')
+		raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=proc.stderr)
+	os.rename(out_path + '.gen', out_path)
+
+def postprocess_instance(inst_yml, partial_path):
+	"""
+	Applies the postprocessing of an instance (the 'postprocess' key of inst_yml)
+	to partial_path + '.post0' and moves the result to partial_path.
+	"""
+	stage = 0
+	if 'postprocess' in inst_yml:
+		assert inst_yml['postprocess'] == 'to_edgelist'
+		convert_to_edgelist(inst_yml,
+				partial_path + '.post0', partial_path + '.post1');
+		os.unlink(partial_path + '.post0')
+		stage = 1
+
+	os.rename(partial_path + '.post{}'.format(stage), partial_path)
+
+def install_instances(insts, max_downloads=4, max_generators=None):
+	"""
+	Installs instances concurrently. Downloads and generator processes are limited
+	separately; by default, one generator per CPU is run.
+	Failures do not abort the installation of other instances; they are reported
+	once all instances are processed.
+	"""
+	import concurrent.futures
+	import subprocess
+	import threading
+
+	if max_generators is None:
+		max_generators = os.cpu_count()
+
+	# On-demand instances are generated by the runs themselves.
+	pending = [inst for inst in insts
+			if inst.on_demand is None and not inst.check_available()]
+	lock = threading.Lock()
+	num_done = 0
+	failures = []
+
+	def install(inst):
+		nonlocal num_done
+		error = None
+		try:
+			inst.install()
+		except Exception as e:
+			error = e
+		with lock:
+			num_done += 1
+			if error is not None:
+				failures.append((inst, error))
+				print("[{}/{}] Failed to install instance '{}': {}".format(num_done, len(pending),
+						inst.shortname, error))
+			else:
+				print("[{}/{}] Installed instance '{}'".format(num_done, len(pending),
+						inst.shortname))
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_downloads) as download_executor, \
+			concurrent.futures.ThreadPoolExecutor(max_workers=max_generators) as generator_executor:
+		for inst in pending:
+			if 'generator' in inst._inst_yml:
+				generator_executor.submit(install, inst)
+			else:
+				download_executor.submit(install, inst)
+
+	if failures:
+		print("The following instances could not be installed:")
+		for (inst, error) in failures:
+			print("    {}: {}".format(inst.shortname, error))
+			if isinstance(error, subprocess.CalledProcessError) and error.stderr:
+				for line in error.stderr.decode(errors='replace').splitlines()[-5:]:
+					print("        " + line)
+		raise RuntimeError("Failed to install {} instance(s)".format(len(failures)))
+
+# ---------------------------------------------------------------------------------------
+# Conversion to SNAP/EdgeList format.
+# Lines that start with a comment prefix are skipped. The first two fields of all other lines
+# are written, separated by a space. Fields are separated by a repository-specific separator;
+# if a line does not contain it, the conversion switches to the other separator (space or tab)
+# for the remainder of the file.
+# ---------------------------------------------------------------------------------------
+
+# Chosen by benchmarks/edgelist.py: larger chunks are slower (16 MiB chunks are slower
+# than the reference implementation) as they no longer fit into the CPU caches.
+EDGELIST_CHUNK_SIZE = 1 << 20
+# Smaller inputs are converted in the calling process; starting a pool of worker
+# processes costs more than it saves.
+EDGELIST_PARALLEL_MIN_SIZE = 16 << 20
+
+def _get_edgelist_format(inst_yml):
 	repo = inst_yml['repo']
 
 	if repo == 'konect':
-		separator = ' '
-		commentPrefix = '%'
+		return (' ', '%')
 	elif repo == 'snap':
-		separator = '\t'
-		commentPrefix = '#'
+		return ('\t', '#')
+	raise RuntimeError("Cannot convert instances of repository {} to edge lists".format(repo))
+
+def _get_other_separator(separator):
+	if separator == ' ':
+		return '\t'
+	return ' '
+
+# Converts lines of text. Returns the separator that is used for subsequent lines.
+def _convert_lines_to_edgelist(lines, separator, comment_prefix, out_f):
+	for line in lines:
+		if line.startswith(comment_prefix):
+			continue
+		split_line = line.strip().split(separator)
+		if len(split_line) < 2:
+			separator = _get_other_separator(separator)
+			split_line = line.strip().split(separator)
+			if len(split_line) < 2:
+				raise Exception("Unknown separator: " + line.strip())
+		split_line = [x for x in filter(lambda x: len(x) > 0, split_line)]
+		(u, v) = split_line[0], split_line[1]
+		out_f.write("{:s} {:s}\n".format(u, v))
+	return separator
+
+def convert_to_edgelist_reference(inst_yml, in_path, out_path):
+	"""Line-by-line implementation of :func:`convert_to_edgelist`."""
+	(separator, comment_prefix) = _get_edgelist_format(inst_yml)
 
-	def get_other_separator(separator):
-		if separator == ' ':
-			return '\t'
-		return ' '
 	with open(in_path, 'r') as in_f:
 		with open(out_path, 'w') as out_f:
-			for line in in_f:
-				if line.startswith(commentPrefix):
+			_convert_lines_to_edgelist(in_f, separator, comment_prefix, out_f)
+
+# Characters that str.strip() removes (in addition to space, tab and newline)
+# and that are not handled by the fast path.
+_UNUSUAL_WHITESPACE_RE = re.compile(rb'[\r\x0b\x0c\x1c-\x1f]')
+
+# Converts a chunk of complete lines using vectorized NumPy operations.
+# Returns a pair (output, separator) or None if the chunk needs to be converted line by line.
+# The output does not depend on the incoming separator: chunks that contain both
+# separators (or neither of them) are never converted here.
+def _convert_chunk_to_edgelist(chunk, comment_prefix):
+	import numpy as np
+
+	if not chunk.isascii() or _UNUSUAL_WHITESPACE_RE.search(chunk):
+		return None
+
+	prefix = comment_prefix.encode()
+	if chunk.startswith(prefix) or b'\n' + prefix in chunk:
+		chunk = re.sub(b'^' + re.escape(prefix) + b'[^\\n]*\\n', b'', chunk, flags=re.MULTILINE)
+	if not chunk:
+		return (b'', None)
+
+	has_space = b' ' in chunk
+	has_tab = b'\t' in chunk
+	if has_space == has_tab:
+		return None
+	separator = b' ' if has_space else b'\t'
+
+	data = np.frombuffer(chunk, dtype=np.uint8)
+	n = len(data)
+	is_newline = data == ord('\n')
+	newlines = np.flatnonzero(is_newline)
+
+	# Find the first and last byte of all fields.
+	is_field = ~is_newline
+	is_field &= data != ord(separator)
+	boundaries = np.flatnonzero(np.diff(is_field.view(np.int8), prepend=0, append=0))
+	starts = boundaries[0::2]
+	ends = boundaries[1::2]
+
+	# Determine the first two fields of each line.
+	lines = np.searchsorted(newlines, starts)
+	firsts = np.flatnonzero(np.diff(lines, prepend=-1))
+	if len(firsts) != len(newlines):
+		return None # Some lines are empty.
+	seconds = firsts + 1
+	if seconds[-1] >= len(starts) or np.any(lines[seconds[:-1]] != lines[firsts[:-1]]) \
+			or lines[seconds[-1]] != lines[firsts[-1]]:
+		return None # Some lines have less than two fields.
+
+	# Keep the first field, the byte after it (i.e., a separator), the second field
+	# and the newline of each line.
+	delta = np.zeros(n + 1, dtype=np.int8)
+	delta[starts[firsts]] += 1
+	delta[ends[firsts] + 1] -= 1
+	delta[starts[seconds]] += 1
+	delta[ends[seconds]] -= 1
+	keep = np.cumsum(delta[:n], dtype=np.int8).view(bool)
+	keep |= is_newline
+
+	if separator != b' ':
+		data = data.copy()
+		data[ends[firsts]] = ord(' ')
+	return (data[keep].tobytes(), separator.decode())
+
+def _read_line_chunks(f, chunk_size):
+	while True:
+		chunk = f.read(chunk_size)
+		if not chunk:
+			return
+		if not chunk.endswith(b'\n'):
+			chunk += f.readline()
+		if not chunk.endswith(b'\n'):
+			chunk += b'\n' # Last line of the file.
+		yield chunk
+
+def convert_to_edgelist(inst_yml, in_path, out_path, chunk_size=EDGELIST_CHUNK_SIZE,
+		processes=None):
+	"""
+	Reformats the network to a SNAP/EdgeList format.
+	The input is processed in chunks of complete lines that are converted in parallel using
+	NumPy. Chunks that cannot be handled by the vectorized fast path (e.g., because they
+	mix separators) are converted line by line, with the same semantics as
+	:func:`convert_to_edgelist_reference`. Without NumPy, the reference implementation is used.
+	Inputs smaller than EDGELIST_PARALLEL_MIN_SIZE (and all inputs on machines with a single
+	CPU) are converted without worker processes.
+	"""
+	import collections
+	import multiprocessing
+
+	try:
+		import numpy
+	except ImportError:
+		convert_to_edgelist_reference(inst_yml, in_path, out_path)
+		return
+
+	(separator, comment_prefix) = _get_edgelist_format(inst_yml)
+
+	if processes is None:
+		processes = os.cpu_count()
+	size = os.path.getsize(in_path)
+	if size <= chunk_size or size < EDGELIST_PARALLEL_MIN_SIZE or os.cpu_count() == 1:
+		processes = 1
+
+	with open(in_path, 'rb') as in_f, open(out_path, 'wb') as out_f:
+		def emit(chunk, result):
+			nonlocal separator
+			if result is not None:
+				(output, chunk_separator) = result
+				out_f.write(output)
+				if chunk_separator is not None:
+					separator = chunk_separator
+				return
+
+			# Emulate the universal newlines mode of text files.
+			text = chunk.decode().replace('\r\n', '\n').replace('\r', '\n')
+			lines = text.split('\n')
+			if not lines[-1]:
+				lines.pop()
+			text_f = io.StringIO()
+			separator = _convert_lines_to_edgelist(lines, separator, comment_prefix, text_f)
+			out_f.write(text_f.getvalue().encode())
+
+		if processes == 1:
+			for chunk in _read_line_chunks(in_f, chunk_size):
+				emit(chunk, _convert_chunk_to_edgelist(chunk, comment_prefix))
+			return
+
+		# Keep a bounded number of chunks in flight such that memory usage does not
+		# depend on the size of the input.
+		with multiprocessing.Pool(processes) as pool:
+			pending = collections.deque()
+			for chunk in _read_line_chunks(in_f, chunk_size):
+				pending.append((chunk, pool.apply_async(_convert_chunk_to_edgelist,
+						(chunk, comment_prefix))))
+				if len(pending) >= 2 * processes:
+					(done_chunk, result) = pending.popleft()
+					emit(done_chunk, result.get())
+			while pending:
+				(done_chunk, result) = pending.popleft()
+				emit(done_chunk, result.get())
+
+# ---------------------------------------------------------------------------------------
+# Conversion to a binary CSR format.
+# The file consists of a 64-byte header, followed by num_nodes + 1 offsets (int64),
+# num_edges adjacency entries (int64) and, if the graph is weighted, num_edges weights
+# (float64). All values are little-endian and all arrays are 8-byte aligned, so they
+# can be mapped with numpy.memmap (see load_csr()).
+# The header contains the magic string CSR_MAGIC, followed by the version, num_nodes,
+# num_edges and flags (uint64 each).
+# ---------------------------------------------------------------------------------------
+
+CSR_MAGIC = b'SIMEXCSR'
+CSR_VERSION = 1
+CSR_HEADER_SIZE = 64
+CSR_FLAG_WEIGHTED = 1
+
+_CSR_HEADER_FORMAT = '<8sQQQQ'
+
+# Extensions of the files that 'simex instances run-transform' writes by default.
+# They can be referenced as @INSTANCE:<ext>@ in experiment arguments.
+TRANSFORM_EXTENSIONS = {
+	'to_edgelist': 'edgelist',
+	'to_csr': 'csr'
+}
+
+def _is_weighted_edge_list(in_path):
+	with open(in_path, 'rb') as f:
+		for line in f:
+			fields = line.split()
+			if not fields or fields[0].startswith((b'%', b'#')):
+				continue
+			return len(fields) >= 3
+	return False
+
+def _parse_edge_chunk(chunk, weighted):
+	import numpy as np
+	import warnings
+
+	if weighted:
+		dtype = [('u', np.int64), ('v', np.int64), ('w', np.float64)]
+		usecols = (0, 1, 2)
+	else:
+		dtype = [('u', np.int64), ('v', np.int64)]
+		usecols = (0, 1)
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore') # Chunks that only contain comments.
+		edges = np.loadtxt(io.BytesIO(chunk), dtype=dtype, usecols=usecols,
+				comments=['%', '#'], ndmin=1)
+	if len(edges) and (edges['u'].min() < 0 or edges['v'].min() < 0):
+		raise RuntimeError("Edge lists must not contain negative node IDs")
+	return edges
+
+def convert_to_csr(in_path, out_path, chunk_size=EDGELIST_CHUNK_SIZE):
+	"""
+	Converts an edge list (lines of the form 'u v [w ...]', comments start with % or #)
+	to the binary CSR format. Node IDs are used as-is, i.e., there are max_id + 1 nodes.
+	Edges are directed; each node's neighbors appear in the order of the input.
+	The third column is stored as weight if it is present in the first line.
+
+	The edge list is read twice: the first pass counts degrees and the second pass
+	scatters the edges into the memory-mapped output file. Hence, only O(num_nodes)
+	memory is required.
+	"""
+	import numpy as np
+
+	weighted = _is_weighted_edge_list(in_path)
+
+	# First pass: compute the degrees of all nodes.
+	degrees = np.zeros(0, dtype=np.int64)
+	with open(in_path, 'rb') as f:
+		for chunk in _read_line_chunks(f, chunk_size):
+			edges = _parse_edge_chunk(chunk, weighted)
+			if not len(edges):
+				continue
+			num_nodes = int(max(edges['u'].max(), edges['v'].max())) + 1
+			if num_nodes > len(degrees):
+				degrees = np.concatenate((degrees,
+						np.zeros(num_nodes - len(degrees), dtype=np.int64)))
+			degrees += np.bincount(edges['u'], minlength=len(degrees))
+	num_nodes = len(degrees)
+	num_edges = int(degrees.sum())
+
+	# Allocate the output file.
+	flags = CSR_FLAG_WEIGHTED if weighted else 0
+	adjacency_offset = CSR_HEADER_SIZE + 8 * (num_nodes + 1)
+	weights_offset = adjacency_offset + 8 * num_edges
+	file_size = weights_offset + (8 * num_edges if weighted else 0)
+
+	tmp_path = out_path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		header = struct.pack(_CSR_HEADER_FORMAT, CSR_MAGIC, CSR_VERSION,
+				num_nodes, num_edges, flags)
+		f.write(header.ljust(CSR_HEADER_SIZE, b'\0'))
+		f.truncate(file_size)
+
+	offsets = np.memmap(tmp_path, dtype='<i8', mode='r+',
+			offset=CSR_HEADER_SIZE, shape=(num_nodes + 1,))
+	offsets[0] = 0
+	np.cumsum(degrees, out=offsets[1:])
+
+	# Second pass: write the edges to their positions.
+	if num_edges:
+		adjacency = np.memmap(tmp_path, dtype='<i8', mode='r+',
+				offset=adjacency_offset, shape=(num_edges,))
+		weights = None
+		if weighted:
+			weights = np.memmap(tmp_path, dtype='<f8', mode='r+',
+					offset=weights_offset, shape=(num_edges,))
+
+		cursor = np.array(offsets[:-1])
+		with open(in_path, 'rb') as f:
+			for chunk in _read_line_chunks(f, chunk_size):
+				edges = _parse_edge_chunk(chunk, weighted)
+				if not len(edges):
 					continue
-				split_line = line.strip().split(separator)
-				if len(split_line) < 2:
-					separator = get_other_separator(separator)
-					split_line = line.strip().split(separator)
-					if len(split_line) < 2:
-						raise Exception("Unknown separator: " + line.strip())
-				split_line = [x for x in filter(lambda x: len(x) > 0, split_line)]
-				(u, v) = split_line[0], split_line[1]
-				out_f.write("{:s} {:s}\n".format(u, v))
+				# Sort the chunk's edges by source (stable, to preserve the input order);
+				# the k-th edge of a source goes to the source's cursor plus k.
+				order = np.argsort(edges['u'], kind='stable')
+				sources = edges['u'][order]
+				firsts = np.flatnonzero(np.diff(sources, prepend=-1))
+				ranks = np.arange(len(sources)) - np.repeat(firsts,
+						np.diff(np.append(firsts, len(sources))))
+				positions = cursor[sources] + ranks
+				adjacency[positions] = edges['v'][order]
+				if weighted:
+					weights[positions] = edges['w'][order]
+				cursor += np.bincount(edges['u'], minlength=num_nodes)
+
+		adjacency.flush()
+		if weighted:
+			weights.flush()
+		del adjacency, weights
+	offsets.flush()
+	del offsets
+
+	os.rename(tmp_path, out_path)
+
+def load_csr(path, mode='r'):
+	"""
+	Maps a file in the binary CSR format. Returns a tuple (offsets, adjacency, weights)
+	of numpy.memmap arrays; weights is None for unweighted graphs.
+	The neighbors of node i are adjacency[offsets[i]:offsets[i + 1]].
+	"""
+	import numpy as np
+
+	with open(path, 'rb') as f:
+		header = f.read(CSR_HEADER_SIZE)
+	(magic, version, num_nodes, num_edges, flags) = struct.unpack_from(_CSR_HEADER_FORMAT, header)
+	if magic != CSR_MAGIC:
+		raise RuntimeError("{} is not a CSR file".format(path))
+	if version != CSR_VERSION:
+		raise RuntimeError("Unsupported CSR version {} in {}".format(version, path))
+
+	def mmap(dtype, offset, count):
+		if not count:
+			return np.zeros(0, dtype=dtype)
+		return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(count,))
+
+	adjacency_offset = CSR_HEADER_SIZE + 8 * (num_nodes + 1)
+	offsets = mmap('<i8', CSR_HEADER_SIZE, num_nodes + 1)
+	adjacency = mmap('<i8', adjacency_offset, num_edges)
+	weights = None
+	if flags & CSR_FLAG_WEIGHTED:
+		weights = mmap('<f8', adjacency_offset + 8 * num_edges, num_edges)
+	return (offsets, adjacency, weights)
+
+# ---------------------------------------------------------------------------------------
+# Instance statistics.
+# Edge lists ('u v [...]' lines, comments start with % or #) are analyzed in a single
+# streaming pass (plus one pass over the spilled edges to count duplicates). Graphs are
+# considered to be undirected. The results are stored in <instance>.info (YAML), together
+# with the size, mtime and SHA-256 hash of the instance file.
+# ---------------------------------------------------------------------------------------
+
+def _degree_summary(degrees):
+	import statistics
+
+	if not degrees:
+		return {'min': 0, 'max': 0, 'mean': 0.0, 'median': 0.0}
+	return {
+		'min': min(degrees),
+		'max': max(degrees),
+		'mean': statistics.mean(degrees),
+		'median': float(statistics.median(degrees))
+	}
+
+# Duplicate edges are counted by partitioning the (normalized) edges into buckets on disk
+# such that each bucket fits into DUPLICATE_MEMORY_LIMIT bytes. Hence, memory usage does
+# not grow with the size of the graph.
+DUPLICATE_MEMORY_LIMIT = 256 << 20
+
+def _get_num_buckets(path):
+	# Each line contains at least 4 bytes ('u v\n'); each edge needs 16 bytes in memory.
+	estimate = 4 * os.path.getsize(path)
+	return max(1, -(-estimate // DUPLICATE_MEMORY_LIMIT))
+
+def _compute_graph_stats_python(path):
+	import tempfile
+
+	num_buckets = _get_num_buckets(path)
+	degrees = {}
+	num_edges = 0
+	self_loops = 0
+	distinct = 0
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		buckets = [open(os.path.join(tmp_dir, str(i)), 'w') for i in range(num_buckets)]
+		try:
+			with open(path, 'rb') as f:
+				for line in f:
+					fields = line.split()
+					if not fields or fields[0].startswith((b'%', b'#')):
+						continue
+					if len(fields) < 2:
+						raise RuntimeError("Not an edge list: {}".format(path))
+					(u, v) = (int(fields[0]), int(fields[1]))
+					num_edges += 1
+					if u == v:
+						self_loops += 1
+					key = (u, v) if u < v else (v, u)
+					buckets[hash(key) % num_buckets].write('{} {}\n'.format(*key))
+					degrees[u] = degrees.get(u, 0) + 1
+					degrees[v] = degrees.get(v, 0) + 1
+		finally:
+			for bucket in buckets:
+				bucket.close()
+
+		for i in range(num_buckets):
+			with open(os.path.join(tmp_dir, str(i)), 'r') as bucket:
+				distinct += len(set(bucket))
+
+	return {
+		'n': len(degrees),
+		'm': num_edges,
+		'self_loops': self_loops,
+		'duplicate_edges': num_edges - distinct,
+		'degree': _degree_summary(list(degrees.values()))
+	}
+
+def _count_distinct_keys(np, keys):
+	if not len(keys):
+		return 0
+	if int(keys.max()) < 1 << 32:
+		# Pack both IDs into a single integer; this is faster than unique(axis=0).
+		packed = (keys[:, 0].astype(np.uint64) << np.uint64(32)) | keys[:, 1].astype(np.uint64)
+		return len(np.unique(packed))
+	return len(np.unique(keys, axis=0))
+
+def compute_graph_stats(path, chunk_size=EDGELIST_CHUNK_SIZE):
+	"""
+	Computes the number of nodes (i.e., distinct IDs) and edges, the number of self-loops
+	and duplicate edges and a summary of the degree distribution of an edge list.
+	Uses NumPy if it is available; otherwise, a (slower) pure Python implementation is used.
+	Memory usage is proportional to the largest node ID (for the degrees) and bounded by
+	DUPLICATE_MEMORY_LIMIT for the duplicate detection, which spills edges to temporary files.
+	"""
+	try:
+		import numpy as np
+	except ImportError:
+		return _compute_graph_stats_python(path)
+	import tempfile
+
+	num_buckets = _get_num_buckets(path)
+	degrees = np.zeros(0, dtype=np.int64)
+	num_edges = 0
+	self_loops = 0
+	distinct = 0
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		bucket_paths = [os.path.join(tmp_dir, str(i)) for i in range(num_buckets)]
+		in_memory = [] # Only used if there is a single bucket.
+		with open(path, 'rb') as f:
+			for chunk in _read_line_chunks(f, chunk_size):
+				try:
+					edges = _parse_edge_chunk(chunk, False)
+				except ValueError:
+					raise RuntimeError("Not an edge list: {}".format(path)) from None
+				if not len(edges):
+					continue
+				(u, v) = (edges['u'], edges['v'])
+
+				max_id = int(max(u.max(), v.max()))
+				if max_id >= len(degrees):
+					degrees = np.concatenate((degrees,
+							np.zeros(max_id + 1 - len(degrees), dtype=np.int64)))
+				degrees += np.bincount(u, minlength=len(degrees))
+				degrees += np.bincount(v, minlength=len(degrees))
+				num_edges += len(edges)
+				self_loops += int(np.count_nonzero(u == v))
+
+				# Duplicates within the chunk do not need to be written.
+				keys = np.unique(np.stack((np.minimum(u, v), np.maximum(u, v)), axis=1), axis=0)
+				if num_buckets == 1:
+					in_memory.append(keys)
+					continue
+				# Multiplicative hashing of both IDs selects the bucket.
+				h = (keys[:, 0].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+						^ keys[:, 1].astype(np.uint64)) * np.uint64(0xBF58476D1CE4E5B9)
+				bucket_ids = (h >> np.uint64(32)) % np.uint64(num_buckets)
+				for i in np.unique(bucket_ids):
+					with open(bucket_paths[i], 'ab') as bucket:
+						keys[bucket_ids == i].astype(np.int64).tofile(bucket)
+
+		if num_buckets == 1:
+			if in_memory:
+				distinct = _count_distinct_keys(np, np.concatenate(in_memory))
+		else:
+			for bucket_path in bucket_paths:
+				if os.path.exists(bucket_path):
+					keys = np.fromfile(bucket_path, dtype=np.int64).reshape(-1, 2)
+					distinct += _count_distinct_keys(np, keys)
+	duplicates = num_edges - distinct
+
+	present = degrees[degrees > 0]
+	degree = {'min': 0, 'max': 0, 'mean': 0.0, 'median': 0.0}
+	if len(present):
+		degree = {
+			'min': int(present.min()),
+			'max': int(present.max()),
+			'mean': float(present.mean()),
+			'median': float(np.median(present))
+		}
+	return {
+		'n': int(len(present)),
+		'm': num_edges,
+		'self_loops': self_loops,
+		'duplicate_edges': int(duplicates),
+		'degree': degree
+	}
+
+def read_info(info_path):
+	try:
+		f = open(info_path, 'r')
+	except FileNotFoundError:
+		return None
+	with f:
+		return util.read_yaml_file(f)
+
+def process_instance_file(path, info_path):
+	"""
+	Computes the statistics of an instance file unless they are cached in the .info file.
+	Files with the same size and mtime are assumed to be unchanged; otherwise, the statistics
+	are only recomputed if the SHA-256 hash of the file changed.
+	Returns True if the .info file was written.
+	"""
+	stat = os.stat(path)
+	info = read_info(info_path)
+	cached_file = info.get('file') if isinstance(info, dict) else None
+	if cached_file is not None and cached_file.get('size') == stat.st_size \
+			and cached_file.get('mtime_ns') == stat.st_mtime_ns:
+		return False
+
+	sha256 = util.hash_file(path)
+	if cached_file is None or cached_file.get('sha256') != sha256:
+		info = compute_graph_stats(path)
+	info['file'] = {
+		'size': stat.st_size,
+		'mtime_ns': stat.st_mtime_ns,
+		'sha256': sha256
+	}
+
+	with open(info_path + '.tmp', 'w') as f:
+		util.write_yaml_file(f, info)
+	os.rename(info_path + '.tmp', info_path)
+	return True
+
+def process_instances(insts, max_workers=None):
+	"""
+	Computes the statistics of multiple instances in parallel worker processes.
+	Instances that are unavailable or consist of multiple files are skipped.
+	"""
+	import concurrent.futures
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+		futures = {}
+		for inst in insts:
+			if not inst.check_available():
+				print("Skipping unavailable instance '{}'".format(inst.shortname))
+				continue
+			if len(inst.filenames) > 1:
+				print("Skipping instance '{}' as it does not have a unique filename".format(
+						inst.shortname))
+				continue
+			future = executor.submit(process_instance_file, inst.fullpath, inst.info_path)
+			futures[future] = inst
+
+		for future in concurrent.futures.as_completed(futures):
+			inst = futures[future]
+			error = future.exception()
+			if error is not None:
+				print("Skipping instance '{}': {}".format(inst.shortname, error))
+			elif future.result():
+				print("Processed instance '{}'".format(inst.shortname))
+
+# ---------------------------------------------------------------------------------------
+# Checksums.
+# The SHA-256 hashes of instance files are cached in <instdir>/_checksums.yml,
+# keyed by file name and stamped with the size and mtime of the file.
+# ---------------------------------------------------------------------------------------
+
+class ChecksumManifest:
+	def __init__(self, path):
+		self.path = path
+		self._entries = {}
+		self._dirty = False
+
+		try:
+			f = open(self.path, 'r')
+		except FileNotFoundError:
+			return
+		with f:
+			data = util.read_yaml_file(f)
+		if isinstance(data, dict):
+			self._entries = data
+
+	def lookup(self, filename, stat):
+		entry = self._entries.get(filename)
+		if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+			return None
+		return entry['sha256']
+
+	def store(self, filename, stat, sha256):
+		self._entries[filename] = {
+			'size': stat.st_size,
+			'mtime_ns': stat.st_mtime_ns,
+			'sha256': sha256
+		}
+		self._dirty = True
+
+	def save(self):
+		if not self._dirty:
+			return
+		with open(self.path + '.tmp', 'w') as f:
+			util.write_yaml_file(f, self._entries)
+		os.rename(self.path + '.tmp', self.path)
+		self._dirty = False
+
+def get_checksum_manifest_path(instance_dir):
+	return os.path.join(instance_dir, '_checksums.yml')
+
+def verify_instances(cfg, insts, max_workers=None):
+	"""
+	Computes the SHA-256 hashes of the files of all available instances (in parallel,
+	unless they are cached) and compares them to the expected hashes from experiments.yml.
+	Returns a list of tuples (instance, filename, status) where status is one of
+	'ok', 'mismatch', 'unchecked' (no expected hash) or 'missing'.
+	"""
+	import concurrent.futures
+
+	manifest = ChecksumManifest(get_checksum_manifest_path(cfg.instance_dir()))
+
+	results = []
+	to_hash = []
+	hashes = {}
+	for inst in insts:
+		for filename in inst.filenames:
+			path = os.path.join(cfg.instance_dir(), filename)
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError:
+				results.append((inst, filename, 'missing'))
+				continue
+			sha256 = manifest.lookup(filename, stat)
+			if sha256 is None:
+				to_hash.append((filename, path, stat))
+			else:
+				hashes[filename] = sha256
+			results.append((inst, filename, None))
+
+	# hashlib releases the GIL while hashing large buffers, so threads suffice.
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+		futures = {executor.submit(util.hash_file, path): (filename, stat)
+				for (filename, path, stat) in to_hash}
+		for future in concurrent.futures.as_completed(futures):
+			(filename, stat) = futures[future]
+			hashes[filename] = future.result()
+			manifest.store(filename, stat, hashes[filename])
+	manifest.save()
+
+	def check(inst, filename):
+		expected = inst.expected_checksums.get(filename)
+		if expected is None:
+			return 'unchecked'
+		if expected.lower() != hashes[filename]:
+			return 'mismatch'
+		return 'ok'
 
+	return [(inst, filename, status if status is not None else check(inst, filename))
+			for (inst, filename, status) in results]
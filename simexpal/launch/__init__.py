@@ -0,0 +1,10 @@
+
+import importlib
+
+# Launchers are imported on first access (see simexpal/__init__.py).
+_SUBMODULES = ['common', 'fork', 'queue', 'sge', 'slurm']
+
+def __getattr__(name):
+	if name in _SUBMODULES:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
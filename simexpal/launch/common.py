@@ -1,13 +1,15 @@
 
+import contextlib
 import os
 import selectors
 import signal
 import subprocess
 import time
 
-import yaml
-
 from .. import base
+from .. import instances
+from .. import nodecache
+from .. import profiling
 from .. import util
 
 class Launcher:
@@ -43,7 +45,7 @@ def create_run_file(run):
 	os.rename(run.aux_file_path('run.tmp'), run.aux_file_path('run'))
 
 # Stores all information that is necessary to invoke a run.
-# This is a view over a POD object which can be YAML-encoded and sent
+# This is a view over a POD object which can be encoded (see util.write_data_file()) and sent
 # over a wire or stored into a file.
 class RunManifest:
 	def __init__(self, yml):
@@ -77,6 +79,18 @@ class RunManifest:
 	def instance_files(self):
 		return self.yml['instance_files']
 
+	@property
+	def on_demand(self):
+		return self.yml.get('on_demand', None)
+
+	@property
+	def stage_instances(self):
+		return self.yml.get('stage_instances', None)
+
+	@property
+	def scratch_dir(self):
+		return self.yml.get('scratch_dir', None)
+
 	@property
 	def experiment(self):
 		return self.yml['experiment']
@@ -171,6 +185,10 @@ class RunManifest:
 		return self.yml['builds'][build_name]['prefix']
 
 def compile_manifest(run):
+	with profiling.span('manifest compilation'):
+		return _compile_manifest(run)
+
+def _compile_manifest(run):
 	exp = run.experiment
 
 	# Perform a DFS to discover all used builds.
@@ -201,6 +219,32 @@ def compile_manifest(run):
 	elif run.instance.has_multi_ext:
 		instance_extensions = run.instance.extensions
 
+	on_demand = None
+	if run.instance.on_demand is not None:
+		filename = run.instance.unique_filename
+		cmd = instances.get_generator_command(run.instance._inst_yml, filename)
+		# The keys of the instance's YAML that postprocess_instance() needs.
+		postprocess = {key: run.instance._inst_yml[key] for key in ['repo', 'postprocess']
+				if key in run.instance._inst_yml}
+		on_demand = {
+			'dir': run.instance.on_demand['dir'],
+			'max_size': nodecache.parse_size(run.instance.on_demand['max_size']),
+			'key': instances.get_generator_key(run.config.basedir, cmd, filename,
+					postprocess=postprocess.get('postprocess')),
+			'generator_args': cmd,
+			'postprocess': postprocess
+		}
+
+	stage_instances = None
+	if 'stage_instances' in exp.info._exp_yml:
+		stage_yml = exp.info._exp_yml['stage_instances']
+		if isinstance(stage_yml, str):
+			stage_yml = {'dir': stage_yml}
+		stage_instances = {
+			'dir': os.path.expanduser(stage_yml['dir']),
+			'max_size': nodecache.parse_size(stage_yml.get('max_size', None))
+		}
+
 	builds_dict = {}
 	for build in recursive_builds:
 		builds_dict[build.name] = {
@@ -244,6 +288,9 @@ def compile_manifest(run):
 		'instance_filename': run.instance.yml_name,
 		'instance_extensions': instance_extensions,
 		'instance_files': instance_files,
+		'on_demand': on_demand,
+		'stage_instances': stage_instances,
+		'scratch_dir': exp.info._exp_yml.get('scratch_dir', None),
 		'repetition': run.repetition,
 		'builds': builds_dict,
 		'args': exp.info._exp_yml['args'],
@@ -253,14 +300,120 @@ def compile_manifest(run):
 		'workdir': exp.info._exp_yml.get('workdir', None)
 	})
 
+@contextlib.contextmanager
+def _use_on_demand_instance(manifest):
+	# Generate the instance into the node-local cache (unless another run already did so).
+	on_demand = manifest.on_demand
+	cache = nodecache.NodeCache(on_demand['dir'], on_demand['max_size'])
+
+	def populate(path):
+		# Apply the same postprocessing as Instance.install().
+		partial_path = os.path.join(path, manifest.instance_yml_name)
+		instances.run_generator(on_demand['generator_args'], partial_path + '.post0',
+				manifest.base_dir)
+		instances.postprocess_instance(on_demand.get('postprocess', {}), partial_path)
+
+	with cache.use(on_demand['key'], populate) as path:
+		yield path
+
+def _get_staged_files(manifest):
+	if manifest.instance_files is not None:
+		files = list(manifest.instance_files)
+	elif manifest.instance_extensions is not None:
+		files = [manifest.instance_yml_name + '.' + ext for ext in manifest.instance_extensions]
+	else:
+		files = [manifest.instance_yml_name]
+	# Outputs of 'simex instances run-transform' are staged if they exist.
+	for ext in instances.TRANSFORM_EXTENSIONS.values():
+		file = manifest.instance_yml_name + '.' + ext
+		if file not in files and os.path.isfile(os.path.join(manifest.instance_dir, file)):
+			files.append(file)
+	return files
+
+@contextlib.contextmanager
+def _use_staged_instance(manifest):
+	# Copy (or hard-link) the instance files into the node-local cache.
+	import hashlib
+	import json
+	import shutil
+
+	stage = manifest.stage_instances
+	cache = nodecache.NodeCache(stage['dir'], stage['max_size'])
+
+	# The key changes if any of the files are modified.
+	files = _get_staged_files(manifest)
+	stamps = []
+	for file in files:
+		st = os.stat(os.path.join(manifest.instance_dir, file))
+		stamps.append([file, st.st_size, st.st_mtime_ns])
+	digest = hashlib.sha256(json.dumps({
+		'instance_dir': manifest.instance_dir,
+		'files': stamps
+	}).encode()).hexdigest()
+
+	def populate(path):
+		for file in files:
+			src = os.path.join(manifest.instance_dir, file)
+			dst = os.path.join(path, file)
+			os.makedirs(os.path.dirname(dst), exist_ok=True)
+			try:
+				os.link(src, dst)
+			except OSError:
+				shutil.copyfile(src, dst)
+
+	with cache.use(manifest.instance + '-' + digest[:16], populate) as path:
+		yield path
+
+@contextlib.contextmanager
+def _use_scratch_dir(manifest):
+	import shutil
+	import tempfile
+
+	scratch_dir = os.path.expanduser(manifest.scratch_dir)
+	os.makedirs(scratch_dir, exist_ok=True)
+	path = tempfile.mkdtemp(dir=scratch_dir,
+			prefix='{}-{}-'.format(manifest.instance, manifest.repetition))
+	try:
+		yield path
+	finally:
+		shutil.rmtree(path, ignore_errors=True)
+
 def invoke_run(manifest):
+	with profiling.span('run'), contextlib.ExitStack() as stack:
+		instance_dir = manifest.instance_dir
+		if manifest.on_demand is not None:
+			instance_dir = stack.enter_context(_use_on_demand_instance(manifest))
+		elif manifest.stage_instances is not None:
+			instance_dir = stack.enter_context(_use_staged_instance(manifest))
+		scratch_dir = None
+		if manifest.scratch_dir is not None:
+			scratch_dir = stack.enter_context(_use_scratch_dir(manifest))
+		_invoke_run(manifest, instance_dir, scratch_dir)
+
+def _invoke_run(manifest, instance_dir, scratch_dir):
+	# Paths that the run writes to. If a scratch directory is used, the files are written
+	# to node-local storage and only moved into place once the run finishes.
+	final_paths = {
+		'out': manifest.output_file_path('out'),
+		'stdout': manifest.aux_file_path('stdout'),
+		'stderr': manifest.aux_file_path('stderr')
+	}
+	if scratch_dir is None:
+		write_paths = final_paths
+	else:
+		write_paths = {ext: os.path.join(scratch_dir, ext) for ext in final_paths}
+
 	# Create the output file. This signals that the run has been started.
 	(stdout_pipe, stdout) = (None, None)
 	with open(manifest.output_file_path('out'), "w") as f:
 		# We do not actually need to write anything to the output file.
 		# However, we might want to pipe experimental output to it.
 		if manifest.output == 'stdout':
-			stdout = os.dup(f.fileno())
+			if scratch_dir is None:
+				stdout = os.dup(f.fileno())
+			else:
+				with open(write_paths['out'], "w") as scratch_f:
+					stdout = os.dup(scratch_f.fileno())
 		else:
 			(stdout_pipe, stdout) = os.pipe()
 			os.set_blocking(stdout_pipe, False)
@@ -278,7 +431,11 @@ def invoke_run(manifest):
 				) from None
 			if len(manifest.instance_files) <= identifier:
 				raise IndexError('File index out of range: {}'.format(identifier))
-			return ''.join([manifest.instance_dir, '/', manifest.instance_files[identifier]])
+			return ''.join([instance_dir, '/', manifest.instance_files[identifier]])
+		elif (identifier in instances.TRANSFORM_EXTENSIONS.values()
+				and identifier not in (manifest.instance_extensions or [])):
+			# Output of 'simex instances run-transform'.
+			return ''.join([instance_dir, '/', manifest.instance_yml_name, '.', identifier])
 		else:
 			if manifest.instance_extensions is None:
 				raise RuntimeError(
@@ -288,17 +445,17 @@ def invoke_run(manifest):
 				raise RuntimeError(
 					f"Unexpected file extension for instance '{manifest.instance}': .{identifier}"
 				) from None
-			return ''.join([manifest.instance_dir, '/', manifest.instance_yml_name, '.', identifier])
+			return ''.join([instance_dir, '/', manifest.instance_yml_name, '.', identifier])
 
 	def substitute(p):
 		if p == 'INSTANCE':
-			return manifest.instance_dir + '/' + manifest.instance_yml_name
+			return instance_dir + '/' + manifest.instance_yml_name
 		elif p.startswith('INSTANCE:'):
 			return get_qualified_filename(p.split(':')[1])
 		elif p == 'REPETITION':
 			return str(manifest.repetition)
 		elif p == 'OUTPUT':
-			return manifest.output_file_path('out')
+			return write_paths['out']
 		elif p.startswith('SOURCE_DIR_FOR:'):
 			return manifest.get_source_dir_for(p.split(':')[1])
 		elif p.startswith('COMPILE_DIR_FOR:'):
@@ -331,9 +488,10 @@ def invoke_run(manifest):
 	# Dumps data from an FD to the FS.
 	# Creates the output file only if something is written.
 	class LazyWriter:
-		def __init__(self, fd, path):
+		def __init__(self, fd, path, flush=True):
 			self._fd = fd
 			self._path = path
+			self._flush = flush
 			self._out = None
 
 		def progress(self):
@@ -345,7 +503,8 @@ def invoke_run(manifest):
 			if self._out is None:
 				self._out = open(self._path, "wb")
 			self._out.write(chunk)
-			self._out.flush()
+			if self._flush:
+				self._out.flush()
 			return True
 
 		def close(self):
@@ -359,9 +518,11 @@ def invoke_run(manifest):
 	sel = selectors.DefaultSelector()
 
 	if manifest.output != 'stdout':
-		stdout_writer = LazyWriter(stdout_pipe, manifest.aux_file_path('stdout'))
+		stdout_writer = LazyWriter(stdout_pipe, write_paths['stdout'],
+				flush=scratch_dir is None)
 		sel.register(stdout_pipe, selectors.EVENT_READ, stdout_writer)
-	stderr_writer = LazyWriter(stderr_pipe, manifest.aux_file_path('stderr'))
+	stderr_writer = LazyWriter(stderr_pipe, write_paths['stderr'],
+			flush=scratch_dir is None)
 	sel.register(stderr_pipe, selectors.EVENT_READ, stderr_writer)
 
 	# Wait until the run program finishes.
@@ -392,6 +553,20 @@ def invoke_run(manifest):
 	stderr_writer.close()
 	runtime = time.perf_counter() - start
 
+	# Publish the outputs. Files are renamed into place such that
+	# they are never observed in a partially copied state.
+	transfer_time = None
+	if scratch_dir is not None:
+		import shutil
+
+		transfer_start = time.perf_counter()
+		for (ext, path) in final_paths.items():
+			if not os.path.exists(write_paths[ext]):
+				continue
+			shutil.copyfile(write_paths[ext], path + '.tmp')
+			os.rename(path + '.tmp', path)
+		transfer_time = time.perf_counter() - transfer_start
+
 	# Collect the status information.
 	status = None
 	sigcode = None
@@ -404,7 +579,9 @@ def invoke_run(manifest):
 	# Create the status file to signal that we are finished.
 	status_dict = {'timeout': did_timeout, 'walltime': runtime,
 			'status': status, 'signal': sigcode}
+	if transfer_time is not None:
+		status_dict['transfer_time'] = transfer_time
 	with open(manifest.output_file_path('status.tmp'), "w") as f:
-		yaml.dump(status_dict, f)
+		util.write_data_file(f, status_dict)
 	os.rename(manifest.output_file_path('status.tmp'), manifest.output_file_path('status'))
 
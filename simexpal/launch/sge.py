@@ -3,7 +3,6 @@ import os
 import subprocess
 import sys
 import tempfile
-import yaml
 
 from .. import util
 from . import common
@@ -62,7 +61,7 @@ class SgeLauncher(common.Launcher):
 			(specfd, specfile) = tempfile.mkstemp(prefix='', suffix='.spec',
 					dir=os.path.join(run.config.basedir, 'aux/_sge'))
 			with os.fdopen(specfd, 'w') as f:
-				yaml.dump(spec_dict, f, default_flow_style=False)
+				util.write_data_file(f, spec_dict)
 
 			sge_args.extend(['-t', '{}-{}'.format(0, len(locked)-1)])
 			invoke_args.extend(['--specfile', specfile, '--sge-index'])
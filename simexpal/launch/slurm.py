@@ -4,7 +4,6 @@ import os
 import subprocess
 import sys
 import tempfile
-import yaml
 
 from .. import util
 from . import common
@@ -52,10 +51,10 @@ class SlurmLauncher(common.Launcher):
 				'manifests': [common.compile_manifest(run).yml for run in locked]
 			}
 
-		(specfd, specfile) = tempfile.mkstemp(prefix='', suffix='-spec.yml',
+		(specfd, specfile) = tempfile.mkstemp(prefix='', suffix='-spec.json',
 				dir=os.path.join(cfg.basedir, 'aux/_slurm'))
 		with os.fdopen(specfd, 'w') as f:
-			util.write_yaml_file(f, specs)
+			util.write_data_file(f, specs)
 
 		# Expand the script that is passed to sbatch.
 		def substitute(p):
@@ -0,0 +1,114 @@
+
+import contextlib
+import os
+import re
+
+from . import util
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+def parse_size(size):
+	"""Parses sizes like 4096, '512M' or '20G' (binary units) into a number of bytes."""
+	if size is None or isinstance(size, int):
+		return size
+	m = _SIZE_RE.match(str(size))
+	if not m:
+		raise RuntimeError("Invalid size {}".format(size))
+	return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+def _get_dir_size(path):
+	size = 0
+	for (dirpath, dirnames, filenames) in os.walk(path):
+		for name in filenames:
+			size += os.lstat(os.path.join(dirpath, name)).st_size
+	return size
+
+class NodeCache:
+	"""
+	Directory on node-local storage that stores files across runs.
+	Each entry is a subdirectory <path>/<key> that is guarded by the file <path>/<key>.lock:
+	runs hold a shared lock while they use the entry, and the entry is populated
+	under an exclusive lock. Hence, concurrent runs on the same node share one copy.
+
+	If max_size is given, entries that are not in use are evicted in LRU order
+	(by the modification time of the entry directory) whenever a new entry is added.
+	"""
+
+	def __init__(self, path, max_size=None):
+		self.path = path
+		self.max_size = parse_size(max_size)
+
+	def entry_path(self, key):
+		return os.path.join(self.path, key)
+
+	@contextlib.contextmanager
+	def use(self, key, populate):
+		"""
+		Yields the path of the entry for the given key. If the entry does not exist yet,
+		populate(path) is called to create its files in the (empty) directory path.
+		The entry is not evicted before the context is left.
+		"""
+		import fcntl
+
+		os.makedirs(self.path, exist_ok=True)
+		entry_path = self.entry_path(key)
+		populated = False
+
+		with open(entry_path + '.lock', 'a') as lock_f:
+			while True:
+				fcntl.flock(lock_f.fileno(), fcntl.LOCK_SH)
+				if os.path.isdir(entry_path):
+					break
+
+				# flock() does not convert locks atomically. The entry might be populated
+				# (or evicted) by another process in between; thus, we need to check again.
+				fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+				if not os.path.isdir(entry_path):
+					tmp_path = entry_path + '.tmp'
+					util.try_rmtree(tmp_path)
+					os.mkdir(tmp_path)
+					try:
+						populate(tmp_path)
+					except BaseException:
+						util.try_rmtree(tmp_path)
+						raise
+					os.rename(tmp_path, entry_path)
+					populated = True
+
+			try:
+				os.utime(entry_path)
+				if populated:
+					self.evict(keep=key)
+				yield entry_path
+			finally:
+				fcntl.flock(lock_f.fileno(), fcntl.LOCK_UN)
+
+	def evict(self, keep=None):
+		"""Removes least recently used entries (except for keep) until the cache fits into max_size."""
+		import fcntl
+
+		if self.max_size is None:
+			return
+
+		with util.locked_file(os.path.join(self.path, '_evict.lock')):
+			entries = []
+			for name in os.listdir(self.path):
+				path = os.path.join(self.path, name)
+				if name.startswith('_') or name.endswith('.tmp') or not os.path.isdir(path):
+					continue
+				entries.append((os.stat(path).st_mtime, name, _get_dir_size(path)))
+
+			total_size = sum(size for (mtime, name, size) in entries)
+			for (mtime, name, size) in sorted(entries):
+				if total_size <= self.max_size:
+					break
+				if name == keep:
+					continue
+				with open(self.entry_path(name) + '.lock', 'a') as lock_f:
+					try:
+						fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+					except BlockingIOError:
+						continue # The entry is in use.
+					util.try_rmtree(self.entry_path(name))
+				total_size -= size
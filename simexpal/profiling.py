@@ -0,0 +1,94 @@
+
+import contextlib
+import os
+import sys
+import time
+
+# If set, simex commands (including internal-invoke) are profiled and a report is written
+# to the directory given by the value (or to the current directory if the value is empty).
+PROFILE_ENV_VAR = 'SIMEX_PROFILE'
+
+_profiler = None
+_spans = {} # Maps span names to [count, total time]. Ordered by first occurrence.
+
+class _NullSpan:
+	def __enter__(self):
+		pass
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+	def __init__(self, name):
+		self.name = name
+		self.start = None
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		entry = _spans.setdefault(self.name, [0, 0.0])
+		entry[0] += 1
+		entry[1] += time.perf_counter() - self.start
+		return False
+
+def span(name):
+	"""
+	Measures the time spent in a coarse phase of a command (e.g., 'config loading').
+	Spans with the same name are accumulated. If profiling is disabled, this is (almost) free.
+	"""
+	if _profiler is None:
+		return _NULL_SPAN
+	return _Span(name)
+
+def is_enabled():
+	return _profiler is not None
+
+def get_report_dir():
+	"""Returns the report directory from the environment or None if profiling is not requested."""
+	if PROFILE_ENV_VAR not in os.environ:
+		return None
+	return os.environ[PROFILE_ENV_VAR] or '.'
+
+def print_summary(stats, top=20):
+	print("simexpal: Time spent per phase:", file=sys.stderr)
+	for (name, (count, total)) in _spans.items():
+		print("    {:30} {:10.4f} s  ({} calls)".format(name, total, count), file=sys.stderr)
+	print("simexpal: Top {} functions by cumulative time:".format(top), file=sys.stderr)
+	stats.sort_stats('cumulative').print_stats(top)
+
+@contextlib.contextmanager
+def profile(report_dir, name='simex', top=20):
+	"""
+	Profiles the enclosed code (via cProfile) if report_dir is not None.
+	Afterwards, the cProfile data is written to <report_dir>/<name>-<pid>.prof (which can be
+	inspected using pstats) and a summary is printed to stderr.
+	"""
+	global _profiler
+
+	if report_dir is None:
+		yield
+		return
+
+	import cProfile
+	import pstats
+
+	_spans.clear()
+	_profiler = cProfile.Profile()
+	_profiler.enable()
+	try:
+		yield
+	finally:
+		_profiler.disable()
+		profiler = _profiler
+		_profiler = None
+
+		os.makedirs(report_dir, exist_ok=True)
+		path = os.path.join(report_dir, '{}-{}.prof'.format(name, os.getpid()))
+		profiler.dump_stats(path)
+
+		stats = pstats.Stats(profiler, stream=sys.stderr)
+		print_summary(stats, top=top)
+		print("simexpal: Profile written to {}".format(path), file=sys.stderr)
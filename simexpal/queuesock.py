@@ -64,7 +64,7 @@ class _Connection:
 			self.recv_buffer += data
 			return
 
-		req = util.yaml_from_string(self.recv_buffer.decode())
+		req = util.data_from_string(self.recv_buffer.decode())
 		resp = self.queue.dispatch(descriptor.get_loop(), req)
 		self.state = _State.DONE
 		self._handle.unregister()
@@ -106,7 +106,7 @@ def sendrecv(m):
 	sockpath = os.path.expanduser('~/.extlq.sock')
 	s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 	s.connect(sockpath)
-	s.send(util.yaml_to_string(m).encode())
+	s.send(util.data_to_string(m).encode())
 	s.close()
 
 def stop_queue():
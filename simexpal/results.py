@@ -0,0 +1,215 @@
+
+import os
+import pickle
+
+from . import util
+
+# Persistent cache for the output of user-supplied parse functions.
+# Entries are keyed by the run's output file (relative to the base directory)
+# and stamped with the size and mtime of the output and status files.
+# A change of the parser version invalidates the whole cache.
+class ResultCache:
+	def __init__(self, path, version):
+		self.path = path
+		self.version = version
+		self._entries = {}
+		self._seen = {}
+		self._dirty = False
+
+		try:
+			f = open(self.path, 'rb')
+		except FileNotFoundError:
+			return
+		with f:
+			try:
+				data = pickle.load(f)
+			except Exception: # The cache is corrupted or was written by an incompatible version.
+				return
+		if not isinstance(data, dict) or data.get('version') != self.version:
+			return
+		self._entries = data['entries']
+
+	@staticmethod
+	def stamp_for(run):
+		"""
+		Returns a stamp that identifies the current state of the run's output files
+		or None if the output files do not exist.
+		"""
+		try:
+			out_stat = os.stat(run.output_file_path('out'))
+			status_stat = os.stat(run.output_file_path('status'))
+		except FileNotFoundError:
+			return None
+		return (out_stat.st_size, out_stat.st_mtime_ns, status_stat.st_mtime_ns)
+
+	def lookup(self, key, stamp):
+		"""Returns a pair (hit, record)."""
+		entry = self._entries.get(key)
+		if entry is None or entry[0] != stamp:
+			return (False, None)
+		self._seen[key] = entry
+		return (True, entry[1])
+
+	def store(self, key, stamp, record):
+		self._seen[key] = (stamp, record)
+		self._dirty = True
+
+	def save(self):
+		# Only keep entries of runs that were seen during this collection.
+		if not self._dirty and len(self._seen) == len(self._entries):
+			return
+
+		util.try_mkdir(os.path.dirname(os.path.dirname(self.path)))
+		util.try_mkdir(os.path.dirname(self.path))
+		with open(self.path + '.tmp', 'wb') as f:
+			pickle.dump({'version': self.version, 'entries': self._seen}, f,
+					protocol=pickle.HIGHEST_PROTOCOL)
+		os.rename(self.path + '.tmp', self.path)
+
+		self._entries = self._seen
+		self._seen = {}
+		self._dirty = False
+
+def cache_path_for(cfg, parse_fn):
+	# Parse functions of different scripts often share their qualified name
+	# (e.g., '__main__.parse'); hence, the key also includes the source file.
+	import hashlib
+
+	name = '{}.{}'.format(getattr(parse_fn, '__module__', None) or '_unknown',
+			getattr(parse_fn, '__qualname__', None) or '_unknown')
+	code = getattr(parse_fn, '__code__', None)
+	source = os.path.abspath(code.co_filename) if code is not None else ''
+	digest = hashlib.sha256(source.encode()).hexdigest()[:16]
+	return os.path.join(cfg.basedir, 'aux', '_results', name + '-' + digest + '.pickle')
+
+# ---------------------------------------------------------------------------------------
+# Run tables.
+# ---------------------------------------------------------------------------------------
+
+RUN_TABLE_COLUMNS = ['experiment', 'variation', 'revision', 'instance', 'repetition',
+		'status', 'walltime']
+
+# Keys of the status file that are already represented by RUN_TABLE_COLUMNS.
+_STATUS_KEYS = {'timeout', 'walltime', 'status', 'signal'}
+
+EXPORT_FORMATS = ['csv', 'parquet', 'arrow']
+
+def collect_run_table(cfg, runs, parse_fn=None, parser_version=None):
+	"""
+	Collects one row per run and returns the table in columnar form, i.e., as a dict
+	that maps column names to lists of equal length.
+
+	Besides RUN_TABLE_COLUMNS, the table contains one column for each additional key
+	that is recorded in the status files (e.g., resource metrics).
+	If parse_fn is given, it is called on the output of all successful runs
+	(see :meth:`simexpal.base.Config.collect_successful_results`); the keys of the
+	returned dicts become additional columns.
+	Additional keys that collide with a name in RUN_TABLE_COLUMNS are prefixed by their
+	source, i.e., they become columns named 'status.<key>' (keys of status files) or
+	'out.<key>' (keys returned by parse_fn). For example, a parsed 'walltime' is stored
+	in the column 'out.walltime'.
+	"""
+
+	cache = None
+	if parse_fn is not None and parser_version is not None:
+		cache = ResultCache(cache_path_for(cfg, parse_fn), parser_version)
+
+	columns = {name: [] for name in RUN_TABLE_COLUMNS}
+	num_rows = 0
+
+	def add_extra(name, value, source):
+		if name in RUN_TABLE_COLUMNS:
+			name = source + '.' + name
+		column = columns.get(name)
+		if column is None:
+			column = [None] * num_rows
+			columns[name] = column
+		if len(column) == num_rows:
+			column.append(value)
+
+	for run in runs:
+		(status, status_dict) = run.get_status_info()
+
+		columns['experiment'].append(run.experiment.name)
+		columns['variation'].append(','.join([variant.name for variant in run.experiment.variation]))
+		columns['revision'].append(run.experiment.revision.name if run.experiment.revision else None)
+		columns['instance'].append(run.instance.shortname)
+		columns['repetition'].append(run.repetition)
+		columns['status'].append(str(status))
+		columns['walltime'].append(status_dict['walltime'] if status_dict is not None else None)
+
+		if status_dict is not None:
+			for (k, v) in status_dict.items():
+				if k not in _STATUS_KEYS:
+					add_extra(k, v, 'status')
+
+		if parse_fn is not None and status.is_positive:
+			record = None
+			hit = False
+			if cache is not None:
+				key = os.path.relpath(run.output_file_path('out'), cfg.basedir)
+				stamp = ResultCache.stamp_for(run)
+				if stamp is not None:
+					(hit, record) = cache.lookup(key, stamp)
+			if not hit:
+				with open(run.output_file_path('out'), 'r') as f:
+					record = parse_fn(run, f)
+				if cache is not None and stamp is not None:
+					cache.store(key, stamp, record)
+			for (k, v) in record.items():
+				add_extra(k, v, 'out')
+
+		num_rows += 1
+		for column in columns.values():
+			if len(column) < num_rows:
+				column.append(None)
+
+	if cache is not None:
+		cache.save()
+	return columns
+
+def _import_pyarrow():
+	try:
+		import pyarrow
+	except ImportError:
+		raise RuntimeError("Exporting to Parquet/Arrow requires the 'pyarrow' package") from None
+	return pyarrow
+
+def write_run_table(columns, path, fmt=None):
+	"""
+	Writes a table (as returned by :func:`collect_run_table`) to a file.
+	The format is one of EXPORT_FORMATS; if it is None, it is derived from the file extension.
+	"""
+
+	if fmt is None:
+		ext = os.path.splitext(path)[1]
+		if ext == '.parquet':
+			fmt = 'parquet'
+		elif ext in ['.arrow', '.feather']:
+			fmt = 'arrow'
+		else:
+			fmt = 'csv'
+
+	if fmt == 'csv':
+		import csv
+
+		names = list(columns.keys())
+		with open(path + '.tmp', 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(names)
+			writer.writerows(zip(*[columns[name] for name in names]))
+		os.rename(path + '.tmp', path)
+	elif fmt in ['parquet', 'arrow']:
+		pyarrow = _import_pyarrow()
+
+		table = pyarrow.table(columns)
+		if fmt == 'parquet':
+			import pyarrow.parquet
+			pyarrow.parquet.write_table(table, path + '.tmp')
+		else:
+			# Feather v2 files are Arrow IPC files that can be memory-mapped.
+			import pyarrow.feather
+			pyarrow.feather.write_feather(table, path + '.tmp', compression='uncompressed')
+		os.rename(path + '.tmp', path)
+	else:
+		raise RuntimeError("Unknown export format {}".format(fmt))
@@ -0,0 +1,131 @@
+
+import numpy as np
+
+from . import util
+
+# Dimensions of the experiment matrix that runs can be grouped by.
+GROUP_COLUMNS = ['experiment', 'variation', 'revision', 'instance', 'repetition']
+DEFAULT_GROUP_BY = ['experiment', 'variation', 'revision', 'instance']
+
+STATISTICS = ['count', 'mean', 'median', 'std', 'min', 'max', 'ci95_low', 'ci95_high']
+
+_T95_TABLE = np.array(util.T95_TABLE)
+
+def t95(dof):
+	"""
+	Vectorized version of :func:`simexpal.util.t95_quantile`.
+	Returns NaN for dof < 1.
+	"""
+	dof = np.asarray(dof, dtype=float)
+	z = 1.959964
+	with np.errstate(divide='ignore', invalid='ignore'):
+		approx = (z + (z**3 + z) / (4 * dof)
+				+ (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2))
+	idx = np.clip(dof, 1, len(_T95_TABLE)).astype(int) - 1
+	res = np.where(dof <= len(_T95_TABLE), _T95_TABLE[idx], approx)
+	return np.where(dof >= 1, res, np.nan)
+
+def _encode_column(column):
+	# Map values to integer codes; None is treated as its own (smallest) value.
+	values = np.asarray(column)
+	if values.dtype.kind in 'iuf':
+		(uniques, codes) = np.unique(values, return_inverse=True)
+		return codes.reshape(-1)
+	values = np.asarray(column, dtype=object)
+	is_none = np.equal(values, None)
+	values = np.where(is_none, '', values).astype(str)
+	(uniques, codes) = np.unique(values, return_inverse=True)
+	return codes.reshape(-1)
+
+def _metric_values(table, metric):
+	try:
+		return np.array(table[metric], dtype=float)
+	except KeyError:
+		raise RuntimeError("Unknown metric {}".format(metric)) from None
+	except (TypeError, ValueError):
+		raise RuntimeError("Metric {} is not numeric".format(metric)) from None
+
+def aggregate(table, by=None, metrics=None, only_finished=True):
+	"""
+	Groups the rows of a run table (see :func:`simexpal.results.collect_run_table`)
+	and computes summary statistics of the given metrics for each group.
+	All reductions are vectorized; there are no per-row Python loops.
+
+	:param: by: List of columns to group by (default: DEFAULT_GROUP_BY).
+	:param: metrics: List of numeric columns to summarize (default: ['walltime']).
+	:param: only_finished: Only consider runs that finished successfully.
+
+	Returns a columnar table (dict of NumPy arrays) with one row per group.
+	It contains the grouping columns and, for each metric m and each statistic s
+	in STATISTICS, a column named m + '_' + s. Missing values (e.g., of
+	unfinished runs) are ignored; statistics of empty groups are NaN.
+	"""
+
+	if by is None:
+		by = DEFAULT_GROUP_BY
+	if metrics is None:
+		metrics = ['walltime']
+	for name in by:
+		if name not in table:
+			raise RuntimeError("Unknown column {}".format(name))
+
+	num_rows = len(table['experiment'])
+	mask = np.ones(num_rows, dtype=bool)
+	if only_finished:
+		mask = np.asarray(table['status'], dtype=object) == 'finished'
+	rows = np.flatnonzero(mask)
+
+	# Compute a group index for each (selected) row.
+	if by:
+		codes = np.stack([_encode_column(table[name])[rows] for name in by], axis=1)
+		(group_codes, first_rows, groups) = np.unique(codes, axis=0,
+				return_index=True, return_inverse=True)
+		groups = groups.reshape(-1)
+		num_groups = len(group_codes)
+	else:
+		first_rows = np.zeros(1 if len(rows) else 0, dtype=int)
+		groups = np.zeros(len(rows), dtype=int)
+		num_groups = len(first_rows)
+
+	res = {}
+	for name in by:
+		res[name] = np.asarray(table[name], dtype=object)[rows][first_rows]
+
+	for metric in metrics:
+		values = _metric_values(table, metric)[rows]
+		valid = ~np.isnan(values)
+		g = groups[valid]
+		v = values[valid]
+
+		# Sort by (group, value) such that each group is a contiguous, sorted segment.
+		order = np.lexsort((v, g))
+		g = g[order]
+		v = v[order]
+
+		stats = {s: np.full(num_groups, np.nan) for s in STATISTICS}
+		stats['count'] = np.zeros(num_groups, dtype=int)
+
+		if len(v):
+			starts = np.flatnonzero(np.concatenate(([True], g[1:] != g[:-1])))
+			counts = np.diff(np.append(starts, len(v)))
+			ids = g[starts]
+
+			means = np.add.reduceat(v, starts) / counts
+			sqdevs = np.add.reduceat((v - np.repeat(means, counts))**2, starts)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				stds = np.where(counts > 1, np.sqrt(sqdevs / (counts - 1)), np.nan)
+			halfwidths = t95(counts - 1) * stds / np.sqrt(counts)
+
+			stats['count'][ids] = counts
+			stats['mean'][ids] = means
+			stats['median'][ids] = (v[starts + (counts - 1) // 2] + v[starts + counts // 2]) / 2
+			stats['std'][ids] = stds
+			stats['min'][ids] = v[starts]
+			stats['max'][ids] = v[starts + counts - 1]
+			stats['ci95_low'][ids] = means - halfwidths
+			stats['ci95_high'][ids] = means + halfwidths
+
+		for s in STATISTICS:
+			res[metric + '_' + s] = stats[s]
+
+	return res
@@ -1,10 +1,12 @@
 
+import contextlib
 import errno
+import hashlib
+import json
 import os
 import re
 import shutil
 import sys
-import yaml
 
 def expand_at_params(s, fn, listfn=None):
 	def subfn(m):
@@ -46,12 +48,41 @@ def try_rmfile(path):
 			raise
 
 def try_rmtree(path):
+	# Symlinks are removed without touching their target.
+	if os.path.islink(path):
+		os.unlink(path)
+		return
 	try:
 		shutil.rmtree(path)
 	except OSError as error:
 		if error.errno != errno.ENOENT:
 			raise
 
+def link_tree(src, dst):
+	"""
+	Copies the directory src to dst. Files are hard-linked if possible (i.e., if src and dst
+	are on the same file system) and copied otherwise; symlinks are preserved.
+	"""
+	def link_or_copy(src_file, dst_file):
+		try:
+			os.link(src_file, dst_file)
+		except OSError:
+			shutil.copy2(src_file, dst_file)
+
+	shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy)
+
+@contextlib.contextmanager
+def locked_file(path):
+	"""Holds an exclusive lock on the given file (which is created if necessary)."""
+	import fcntl
+
+	with open(path, 'a') as f:
+		fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
 def touch(path):
 	with open(path, 'w'):
 		pass
@@ -59,19 +90,46 @@ def touch(path):
 did_warn_libyaml = False
 
 def yaml_to_string(yml):
+	import yaml
 	return yaml.dump(yml, Dumper=yaml.SafeDumper)
 
 def write_yaml_file(f, yml):
+	import yaml
 	return yaml.dump(yml, f, Dumper=yaml.SafeDumper)
 
 def yaml_from_string(string):
+	import yaml
 	return yaml.load(string, Loader=yaml.SafeLoader)
 
 def read_yaml_file(f):
+	import yaml
 	return yaml.load(f, Loader=yaml.SafeLoader)
 
+# Status files, specfiles and run manifests are stored as JSON, which is much faster to parse
+# than YAML. Since JSON is (almost) a subset of YAML, older versions of simexpal can still read them.
+# Files that were written as YAML by older versions are read via a fallback.
+
+def data_to_string(data):
+	return json.dumps(data, sort_keys=True)
+
+def write_data_file(f, data):
+	json.dump(data, f, sort_keys=True)
+	f.write('\n')
+
+def data_from_string(string):
+	try:
+		return json.loads(string)
+	except ValueError:
+		pass
+	import yaml
+	return yaml.load(string, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+def read_data_file(f):
+	return data_from_string(f.read())
+
 def read_setup_file(setup_file):
 	global did_warn_libyaml
+	import yaml
 
 	with open(setup_file, 'r') as f:
 		Loader = yaml.SafeLoader
@@ -97,18 +155,35 @@ def validate_setup_file(setup_file):
 
 	return setup_dict
 
-def compute_network_size(path, out):
-	import networkit as nk
-	try:
-		g = nk.readGraph(path, nk.Format.EdgeList,
-				separator=' ', firstNode=0, continuous=False, directed=False)
-	except Exception: # Exception due the attempt of reading a non-network file
-		return
-	data = {
-		'n': g.numberOfNodes(),
-		'm': g.numberOfEdges()
-	}
-	yaml.dump(data, out, default_flow_style=False)
+# Two-sided 95% quantiles of Student's t-distribution for 1 to 30 degrees of freedom.
+T95_TABLE = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+		2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+		2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+def t95_quantile(dof):
+	"""
+	Returns the two-sided 95% quantile of Student's t-distribution.
+	Uses a table for small degrees of freedom and a Cornish-Fisher expansion otherwise.
+	"""
+	if dof < 1:
+		return float('nan')
+	if dof <= len(T95_TABLE):
+		return T95_TABLE[int(dof) - 1]
+	z = 1.959964
+	return z + (z**3 + z) / (4 * dof) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * dof**2)
+
+def relative_ci95_width(values):
+	"""Returns the width of the 95% confidence interval of the mean, relative to the mean."""
+	import math
+	import statistics
+
+	if len(values) < 2:
+		return float('inf')
+	mean = statistics.mean(values)
+	if mean == 0:
+		return float('inf')
+	halfwidth = t95_quantile(len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values))
+	return 2 * halfwidth / abs(mean)
 
 def ensure_list_type(arg):
 	if isinstance(arg, list):
@@ -116,6 +191,16 @@ def ensure_list_type(arg):
 	assert isinstance(arg, str)
 	return [arg]
 
+def hash_file(path, algorithm='sha256', chunk_size=1 << 20):
+	h = hashlib.new(algorithm)
+	with open(path, 'rb') as f:
+		while True:
+			chunk = f.read(chunk_size)
+			if not chunk:
+				break
+			h.update(chunk)
+	return h.hexdigest()
+
 def read_file(path):
 	try:
 		f = open(path, 'r')